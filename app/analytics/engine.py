@@ -0,0 +1,167 @@
+"""
+In-process аналитический движок для эндпоинтов /students/*.
+
+Хранит количество оценок каждого вида по студентам в колоночном виде:
+ФИО интернируются в целочисленные id, для каждой оценки из VALID_GRADES
+хранится отдельная колонка счетчиков (NumPy, если установлен, иначе array).
+Загружается из БД при старте и инкрементально обновляется после каждой
+успешной загрузки CSV, поэтому пороговые запросы не обращаются к PostgreSQL.
+
+Движок видит только загрузки, прошедшие через текущий процесс: при запуске
+нескольких воркеров его нужно отключать (ANALYTICS_ENGINE_ENABLED=false).
+Студенты с одинаковыми счетчиками упорядочиваются по кодовым точкам ФИО, а не по
+collation БД, как в SQL-запросах.
+"""
+import logging
+import operator
+import threading
+from array import array
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Optional
+from app.config import validation_config, analytics_config
+from app.db.data_version import get_data_version
+from app.db.grade_counts import iter_grade_counts
+
+try:
+    import numpy as np
+except ImportError:  # NumPy опционален, без него используются циклы по array
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_INITIAL_CAPACITY = 1024
+
+
+class GradeCountsEngine:
+    """Колоночное хранилище счетчиков оценок по студентам"""
+
+    def __init__(self, grades: Iterable[int]):
+        self._lock = threading.Lock()
+        self._grades = list(grades)
+        self._name_ids: dict[str, int] = {}
+        self._names: list[str] = []
+        self._columns = {grade: self._new_column(_INITIAL_CAPACITY) for grade in self._grades}
+        # Результаты запросов кешируются до следующего изменения данных
+        self._cache: dict[tuple, list[tuple[str, int]]] = {}
+        # Версия данных БД, которой соответствует содержимое движка (для ETag)
+        self.data_version: tuple[int, Optional[datetime]] = (0, None)
+        self.ready = False
+
+    @property
+    def student_count(self) -> int:
+        return len(self._names)
+
+    @staticmethod
+    def _new_column(capacity: int):
+        if np is not None:
+            return np.zeros(capacity, dtype=np.int64)
+        return array("q")
+
+    def _intern(self, full_name: str) -> int:
+        student_id = self._name_ids.get(full_name)
+        if student_id is not None:
+            return student_id
+
+        student_id = len(self._names)
+        self._name_ids[full_name] = student_id
+        self._names.append(full_name)
+
+        if np is not None:
+            capacity = len(next(iter(self._columns.values()), ()))
+            if student_id >= capacity:
+                for grade, column in self._columns.items():
+                    grown = np.zeros(capacity * 2, dtype=np.int64)
+                    grown[:capacity] = column
+                    self._columns[grade] = grown
+        else:
+            for column in self._columns.values():
+                column.append(0)
+        return student_id
+
+    def _add(self, rows: Iterable[tuple[str, int, int]]):
+        for full_name, grade, count in rows:
+            if grade not in self._columns:
+                continue
+            # Колонки могут быть пересозданы при росте, поэтому берем их после интернирования
+            student_id = self._intern(full_name)
+            self._columns[grade][student_id] += count
+        self._cache.clear()
+
+    def load(self, rows: Iterable[tuple[str, int, int]], data_version: tuple[int, datetime]):
+        """Полная загрузка из строк (full_name, grade, count) версии данных data_version"""
+        with self._lock:
+            self._name_ids = {}
+            self._names = []
+            self._columns = {grade: self._new_column(_INITIAL_CAPACITY) for grade in self._grades}
+            self._add(rows)
+            self.data_version = data_version
+            self.ready = True
+
+    def apply(self, grade_counts: Counter, data_version: tuple[int, datetime]):
+        """Инкрементальное обновление данными одной загрузки {(full_name, grade): count}"""
+        with self._lock:
+            self._add((full_name, grade, count) for (full_name, grade), count in grade_counts.items())
+            self.data_version = data_version
+
+    def query(self, grade: int, gt: Optional[int] = None, lt: Optional[int] = None) -> list[tuple[str, int]]:
+        """
+        Студенты, у которых число оценок grade больше gt и/или меньше lt.
+        Результат отсортирован по убыванию количества, затем по ФИО. ФИО сравниваются
+        по кодовым точкам, а не по collation БД, поэтому порядок студентов с одинаковым
+        количеством может отличаться от SQL-запросов.
+        """
+        if grade not in self._columns:
+            raise ValueError(f"Оценка {grade} не входит в VALID_GRADES")
+
+        key = (grade, gt, lt)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+
+            size = len(self._names)
+            column = self._columns[grade]
+
+            if np is not None:
+                counts = column[:size]
+                mask = np.ones(size, dtype=bool)
+                if gt is not None:
+                    mask &= counts > gt
+                if lt is not None:
+                    mask &= counts < lt
+                ids = np.flatnonzero(mask)
+                selected = [(self._names[i], c) for i, c in zip(ids.tolist(), counts[ids].tolist())]
+            else:
+                selected = [
+                    (self._names[i], count)
+                    for i, count in enumerate(column)
+                    if (gt is None or count > gt) and (lt is None or count < lt)
+                ]
+
+            selected.sort(key=operator.itemgetter(0))
+            selected.sort(key=operator.itemgetter(1), reverse=True)
+            self._cache[key] = selected
+            return selected
+
+
+def load_engine_from_db(engine: GradeCountsEngine, conn):
+    """Загрузка счетчиков из представления grade_counts (свертки и строки grades)"""
+    version_cursor = conn.cursor()
+    try:
+        # Версия данных и счетчики читаются из одного снимка
+        version_cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        data_version = get_data_version(version_cursor)
+        engine.load(iter_grade_counts(conn, "load_analytics_engine"), data_version)
+        logger.info(f"Аналитический движок загружен: студентов {engine.student_count}, версия данных {data_version[0]}")
+    finally:
+        version_cursor.close()
+        conn.rollback()
+
+
+analytics_engine = GradeCountsEngine(validation_config.VALID_GRADES)
+
+
+def engine_enabled() -> bool:
+    """Движок включен в конфигурации и загружен"""
+    return analytics_config.ANALYTICS_ENGINE_ENABLED and analytics_engine.ready
@@ -0,0 +1,248 @@
+"""
+Вероятностные скетчи для приближенной аналитики.
+
+- Count-Min Sketch — приближенное число оценок каждого вида у студента.
+  Оценка никогда не бывает меньше точного значения и с вероятностью 1 - delta
+  превышает его не более чем на epsilon * N, где N — общее число записей.
+- HyperLogLog — приближенное число уникальных студентов
+  со стандартной относительной ошибкой 1.04 / sqrt(2^precision).
+
+Скетчи хранятся в таблице grade_sketches, строятся по имеющимся данным при первой
+загрузке, затем обновляются в транзакции каждой загрузки и объединяются поэлементно (сумма для CMS, максимум для HLL), поэтому результат
+не зависит от того, каким числом загрузок были получены данные.
+"""
+import sys
+import math
+import struct
+import hashlib
+import logging
+from array import array
+from collections import Counter
+from typing import Iterable, Optional
+from app.config import analytics_config
+from app.db.grade_counts import iter_grade_counts
+
+logger = logging.getLogger(__name__)
+
+# Имена скетчей в таблице grade_sketches
+CMS_SKETCH_NAME = "grade_counts_cms"
+HLL_SKETCH_NAME = "students_hll"
+
+# Счетчики CMS хранятся в БД в little-endian независимо от платформы
+_NATIVE_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def _hash_128(key: str) -> tuple[int, int]:
+    """Два независимых 64-битных хеша ключа"""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+def grade_key(full_name: str, grade: int) -> str:
+    """Ключ CMS для пары (студент, оценка)"""
+    return f"{full_name}\x1f{grade}"
+
+
+class CountMinSketch:
+    """Count-Min Sketch с 64-битными счетчиками"""
+
+    _HEADER = struct.Struct("<IIQ")  # width, depth, total
+
+    def __init__(self, width: int, depth: int, counters: Optional[array] = None, total: int = 0):
+        self.width = width
+        self.depth = depth
+        self.total = total
+        self.counters = counters if counters is not None else array("Q", bytes(8 * width * depth))
+
+    @classmethod
+    def from_error_bounds(cls, epsilon: float, delta: float) -> "CountMinSketch":
+        """Создание скетча по допустимой погрешности epsilon и вероятности ее превышения delta"""
+        width = math.ceil(math.e / epsilon)
+        depth = math.ceil(math.log(1 / delta))
+        return cls(width, depth)
+
+    @property
+    def epsilon(self) -> float:
+        return math.e / self.width
+
+    @property
+    def delta(self) -> float:
+        return math.exp(-self.depth)
+
+    def _indexes(self, key: str):
+        h1, h2 = _hash_128(key)
+        width = self.width
+        for row in range(self.depth):
+            yield row * width + (h1 + row * h2) % width
+
+    def add(self, key: str, count: int = 1):
+        counters = self.counters
+        for index in self._indexes(key):
+            counters[index] += count
+        self.total += count
+
+    def estimate(self, key: str) -> int:
+        counters = self.counters
+        return min(counters[index] for index in self._indexes(key))
+
+    def error_bound(self) -> int:
+        """Максимальное завышение оценки (с вероятностью 1 - delta)"""
+        return math.ceil(self.epsilon * self.total)
+
+    def merge(self, other: "CountMinSketch"):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Нельзя объединить Count-Min Sketch разных размеров")
+        counters = self.counters
+        for index, value in enumerate(other.counters):
+            if value:
+                counters[index] += value
+        self.total += other.total
+
+    def to_bytes(self) -> bytes:
+        counters = self.counters
+        if not _NATIVE_LITTLE_ENDIAN:
+            counters = array("Q", counters)
+            counters.byteswap()
+        return self._HEADER.pack(self.width, self.depth, self.total) + counters.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CountMinSketch":
+        width, depth, total = cls._HEADER.unpack_from(data)
+        counters = array("Q")
+        counters.frombytes(data[cls._HEADER.size:])
+        if not _NATIVE_LITTLE_ENDIAN:
+            counters.byteswap()
+        return cls(width, depth, counters, total)
+
+
+class HyperLogLog:
+    """HyperLogLog с 64-битным хешем и коррекцией для малых мощностей"""
+
+    def __init__(self, precision: int, registers: Optional[bytearray] = None):
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    @property
+    def relative_error(self) -> float:
+        """Стандартная относительная ошибка оценки"""
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, value: str):
+        x, _ = _hash_128(value)
+        p = self.precision
+        index = x >> (64 - p)
+        rest = x & ((1 << (64 - p)) - 1)
+        rank = (64 - p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self) -> int:
+        registers = self.registers
+        m = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in registers)
+        zeros = registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+    def merge(self, other: "HyperLogLog"):
+        if self.precision != other.precision:
+            raise ValueError("Нельзя объединить HyperLogLog разной точности")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(data[0], bytearray(data[1:]))
+
+
+def _new_cms() -> CountMinSketch:
+    return CountMinSketch.from_error_bounds(
+        analytics_config.SKETCH_CMS_EPSILON, analytics_config.SKETCH_CMS_DELTA
+    )
+
+
+def _new_hll() -> HyperLogLog:
+    return HyperLogLog(analytics_config.SKETCH_HLL_PRECISION)
+
+
+def load_sketches(cursor, for_update: bool = False) -> tuple[Optional[CountMinSketch], Optional[HyperLogLog]]:
+    """Загрузка скетчей из БД (None, если скетч еще не построен)"""
+    cursor.execute(
+        "SELECT name, data FROM grade_sketches WHERE name IN (%s, %s)"
+        + (" FOR UPDATE" if for_update else ""),
+        (CMS_SKETCH_NAME, HLL_SKETCH_NAME)
+    )
+    stored = {name: data for name, data in cursor.fetchall()}
+    cms_data = stored.get(CMS_SKETCH_NAME)
+    hll_data = stored.get(HLL_SKETCH_NAME)
+    cms = CountMinSketch.from_bytes(bytes(cms_data)) if cms_data is not None else None
+    hll = HyperLogLog.from_bytes(bytes(hll_data)) if hll_data is not None else None
+    return cms, hll
+
+
+def _save_sketches(cursor, cms: CountMinSketch, hll: HyperLogLog):
+    cursor.executemany("""
+        INSERT INTO grade_sketches (name, data, updated_at)
+        VALUES (%s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (name) DO UPDATE
+        SET data = EXCLUDED.data, updated_at = EXCLUDED.updated_at
+    """, [
+        (CMS_SKETCH_NAME, cms.to_bytes()),
+        (HLL_SKETCH_NAME, hll.to_bytes())
+    ])
+
+
+def update_sketches(cursor, grade_counts: Counter):
+    """
+    Добавление в скетчи данных одной загрузки.
+    Вызывается в транзакции загрузки после вставки строк: строки скетчей блокируются
+    (FOR UPDATE), поэтому параллельные загрузки объединяются последовательно.
+    Если скетчи еще не построены (сразу после миграции 002), они строятся по всем
+    данным grade_counts в этой же транзакции — строки текущей загрузки уже входят в них.
+    Размеры уже сохраненных скетчей сохраняются, даже если конфигурация изменилась.
+    """
+    cms, hll = load_sketches(cursor, for_update=True)
+    if cms is None or hll is None:
+        cms, hll = build_sketches(iter_grade_counts(cursor.connection, "build_sketches"))
+        logger.info(f"Скетчи построены по имеющимся данным: записей {cms.total}, студентов ~{hll.estimate()}")
+    else:
+        for (full_name, grade), count in grade_counts.items():
+            cms.add(grade_key(full_name, grade), count)
+        for full_name in {full_name for full_name, _ in grade_counts}:
+            hll.add(full_name)
+
+    _save_sketches(cursor, cms, hll)
+
+
+def build_sketches(rows: Iterable[tuple[str, int, int]]) -> tuple[CountMinSketch, HyperLogLog]:
+    """Построение скетчей по строкам (full_name, grade, count) с размерами из конфигурации"""
+    cms = _new_cms()
+    hll = _new_hll()
+    for full_name, grade, count in rows:
+        cms.add(grade_key(full_name, grade), count)
+        hll.add(full_name)
+    return cms, hll
+
+
+def rebuild_sketches(conn):
+    """
+    Полная пересборка скетчей по представлению grade_counts (свертки и строки grades).
+    Нужна после изменения параметров SKETCH_* в конфигурации (rebuild_sketches.py).
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("LOCK TABLE grade_sketches IN EXCLUSIVE MODE")
+        cms, hll = build_sketches(iter_grade_counts(conn, "rebuild_sketches"))
+        _save_sketches(cursor, cms, hll)
+        conn.commit()
+        logger.info(f"Скетчи пересобраны: записей {cms.total}, студентов ~{hll.estimate()}")
+        return cms, hll
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
@@ -1,8 +1,9 @@
 from fastapi import APIRouter
-from app.api import upload, students
+from app.api import upload, students, debug
 
 router = APIRouter()
 
 router.include_router(upload.router, tags=["upload"])
 router.include_router(students.router, prefix="/students", tags=["students"])
 
+router.include_router(debug.router, prefix="/debug", tags=["debug"])
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException
+from app.config import profiling_config
+from app.db.profiling import get_slow_queries
+
+router = APIRouter()
+
+
+@router.get("/slow-queries")
+async def slow_queries():
+    """
+    Последние медленные SQL-запросы (длительность, число строк, эндпоинт и,
+    для выборочных запросов, план EXPLAIN ANALYZE)
+    """
+    if not profiling_config.DEBUG_ENDPOINTS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    queries = get_slow_queries()
+    return {
+        "threshold_ms": profiling_config.SLOW_QUERY_THRESHOLD_MS,
+        "count": len(queries),
+        "queries": queries
+    }
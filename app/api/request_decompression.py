@@ -0,0 +1,123 @@
+"""
+Распаковка тел запросов со сжатием на уровне всего запроса (Content-Encoding: gzip / zstd).
+
+Тело сохраняется во временный файл (в памяти до SPOOL_SIZE), распаковывается
+с теми же проверками сигнатуры, целостности и объема, что и сжатые CSV-файлы,
+и передается приложению уже несжатым — multipart разбирается как обычно.
+Такой запрос помечается в scope["state"], чтобы эндпоинт проверял размер файла
+по лимиту распакованных данных, а не по лимиту передаваемого файла.
+"""
+import shutil
+import tempfile
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from app.config import validation_config
+from app.ingest.compression import CompressedInputError, detect_compression, open_stream
+
+# Объем тела, хранимый в памяти до сброса во временный файл
+SPOOL_SIZE = 1024 * 1024
+# Размер порции, которой распакованное тело передается приложению
+BODY_CHUNK_SIZE = 64 * 1024
+# Запас на заголовки и границы multipart сверх MAX_FILE_SIZE
+_MULTIPART_OVERHEAD = 64 * 1024
+
+_SUPPORTED_ENCODINGS = {"gzip", "x-gzip", "zstd"}
+
+# Ключ в scope["state"] (request.state): тело запроса было сжатым и распаковано
+_DECOMPRESSED_STATE_KEY = "request_decompressed"
+
+
+def is_request_decompressed(request) -> bool:
+    """Тело запроса пришло сжатым (Content-Encoding запроса) и распаковано middleware"""
+    return getattr(request.state, _DECOMPRESSED_STATE_KEY, False)
+
+
+class RequestDecompressionMiddleware:
+    """ASGI middleware: распаковка тел запросов с Content-Encoding gzip / zstd"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        content_encoding = Headers(scope=scope).get("content-encoding", "").strip().lower()
+        if not content_encoding or content_encoding == "identity":
+            return await self.app(scope, receive, send)
+        if content_encoding not in _SUPPORTED_ENCODINGS:
+            response = JSONResponse(
+                status_code=415,
+                content={"detail": f"Неподдерживаемое сжатие запроса: {content_encoding}"}
+            )
+            return await response(scope, receive, send)
+
+        compressed = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            error = await self._read_body(receive, compressed)
+            # Пустое тело (например, у GET) передается как есть
+            if error is None and compressed.tell() > 0:
+                error = self._decompress(compressed, content_encoding, body)
+            if error is not None:
+                status_code, detail = error
+                response = JSONResponse(status_code=status_code, content={"detail": detail})
+                return await response(scope, receive, send)
+
+            size = body.tell()
+            body.seek(0)
+            headers = [
+                (name, value) for name, value in scope["headers"]
+                if name not in (b"content-encoding", b"content-length")
+            ]
+            headers.append((b"content-length", str(size).encode("latin-1")))
+            scope = dict(scope, headers=headers)
+            scope.setdefault("state", {})[_DECOMPRESSED_STATE_KEY] = compressed.tell() > 0
+
+            body_sent = False
+
+            async def receive_decompressed():
+                nonlocal body_sent
+                if body_sent:
+                    # Тело передано полностью, дальше ожидаем отключение клиента
+                    return await receive()
+                chunk = body.read(BODY_CHUNK_SIZE)
+                body_sent = body.tell() >= size
+                return {"type": "http.request", "body": chunk, "more_body": not body_sent}
+
+            await self.app(scope, receive_decompressed, send)
+        finally:
+            compressed.close()
+            body.close()
+
+    @staticmethod
+    async def _read_body(receive, target):
+        """Чтение сжатого тела с ограничением объема; (статус, сообщение) при ошибке"""
+        limit = validation_config.MAX_FILE_SIZE + _MULTIPART_OVERHEAD
+        total = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return 400, "Клиент отключился до окончания передачи запроса"
+            chunk = message.get("body", b"")
+            total += len(chunk)
+            if total > limit:
+                return 413, f"Размер запроса превышает максимально допустимый ({validation_config.MAX_FILE_SIZE_MB} МБ)"
+            target.write(chunk)
+            if not message.get("more_body", False):
+                return None
+
+    @staticmethod
+    def _decompress(source, content_encoding: str, target):
+        """Распаковка тела в target; (статус, сообщение) при ошибке"""
+        try:
+            source.seek(0)
+            compression = detect_compression("", content_encoding, source.read(4))
+            shutil.copyfileobj(
+                open_stream(source, compression, validation_config.MAX_DECOMPRESSED_SIZE),
+                target,
+                BODY_CHUNK_SIZE
+            )
+        except CompressedInputError as e:
+            return 400, str(e)
+        return None
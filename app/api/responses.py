@@ -0,0 +1,148 @@
+"""
+Ответы аналитических эндпоинтов с учетом версии данных.
+
+- ETag / Last-Modified по версии данных и 304 Not Modified на условные запросы
+- кеширование сериализованного ответа до изменения версии данных
+- сжатие brotli / gzip по Accept-Encoding
+- быстрая сериализация через orjson (если установлен)
+"""
+import gzip
+import json
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable, Optional
+from fastapi import Request, Response
+
+try:
+    import orjson
+except ImportError:  # orjson опционален, без него используется стандартный json
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli опционален, без него сжатие только gzip
+    brotli = None
+
+# Ответы меньше этого размера не сжимаются
+MIN_COMPRESS_SIZE = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def dumps(content: Any) -> bytes:
+    """Сериализация в JSON (UTF-8, без экранирования кириллицы)"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Выбор сжатия по Accept-Encoding: brotli (если доступен), затем gzip"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if token:
+            accepted[token.strip().lower()] = quality
+
+    for encoding in (["br"] if brotli is not None else []) + ["gzip"]:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def make_etag(resource: str, version: int) -> str:
+    """Слабый ETag: тело одинаково для всех вариантов сжатия"""
+    return f'W/"{version}-{resource}"'
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Проверка условного запроса (If-None-Match имеет приоритет над If-Modified-Since)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # Слабое сравнение: W/ префикс не учитывается
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag.removeprefix("W/") in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP-даты имеют точность до секунды
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+class _CacheEntry:
+    def __init__(self, version: int, body: bytes):
+        self.version = version
+        self.body = body
+        self.encoded: dict[str, bytes] = {}
+
+
+# Последний сериализованный ответ для каждого ресурса
+_cache: dict[str, _CacheEntry] = {}
+_cache_lock = threading.Lock()
+
+
+def versioned_json_response(
+    request: Request,
+    resource: str,
+    version: int,
+    updated_at: datetime,
+    build: Callable[[], Any]
+) -> Response:
+    """
+    Ответ ресурса для версии данных version.
+    build вызывается только если ответ этой версии еще не закеширован
+    и клиент не прислал актуальный ETag / If-Modified-Since.
+    """
+    etag = make_etag(resource, version)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(updated_at.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding"
+    }
+
+    if is_not_modified(request, etag, updated_at):
+        return Response(status_code=304, headers=headers)
+
+    with _cache_lock:
+        entry = _cache.get(resource)
+    if entry is None or entry.version != version:
+        entry = _CacheEntry(version, dumps(build()))
+        with _cache_lock:
+            _cache[resource] = entry
+
+    body = entry.body
+    if len(body) >= MIN_COMPRESS_SIZE:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+        if encoding is not None:
+            encoded = entry.encoded.get(encoding)
+            if encoded is None:
+                encoded = entry.encoded[encoding] = _compress(body, encoding)
+            body = encoded
+            headers["Content-Encoding"] = encoding
+
+    return Response(content=body, media_type="application/json", headers=headers)
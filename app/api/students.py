@@ -1,95 +1,161 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
 import logging
 from app.db.connection import get_db_connection, return_db_connection
+from app.db.data_version import get_data_version
+from app.api.responses import versioned_json_response
+from app.analytics.sketches import load_sketches, grade_key
+from app.analytics.engine import analytics_engine, engine_enabled
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+def students_twos_response(request: Request, resource: str, sql: str, gt=None, lt=None):
+    """
+    Ответ эндпоинта со списком студентов и числом двоек.
+    Версия данных берется из аналитического движка (если включен) или из БД;
+    при актуальном ETag клиента и для уже закешированной версии запрос к grades не выполняется.
+    Студенты с одинаковым числом двоек упорядочиваются по ФИО: в SQL — по collation БД,
+    в движке — по кодовым точкам, поэтому в режиме движка их порядок может отличаться.
+    """
+    conn = None
+    cursor = None
+    
+    try:
+        if engine_enabled():
+            version, updated_at = analytics_engine.data_version
+        else:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            version, updated_at = get_data_version(cursor)
+        
+        def build():
+            if cursor is None:
+                results = analytics_engine.query(2, gt=gt, lt=lt)
+            else:
+                cursor.execute(sql)
+                results = cursor.fetchall()
+            
+            students = [
+                {
+                    "full_name": row[0],
+                    "count_twos": row[1]
+                }
+                for row in results
+            ]
+            
+            logger.info(f"Найдено студентов ({resource}): {len(students)}")
+            return students
+        
+        return versioned_json_response(request, resource, version, updated_at, build)
+        
+    except Exception as e:
+        logger.error(f"Ошибка при получении данных ({resource}): {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении данных: {str(e)}")
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            return_db_connection(conn)
+
 @router.get("/more-than-3-twos")
-async def get_students_more_than_3_twos():
+async def get_students_more_than_3_twos(request: Request):
     """
     Возвращает ФИО студентов, у которых оценка 2 встречается больше 3 раз.
     """
+    return students_twos_response(request, "more-than-3-twos", """
+        SELECT 
+            full_name,
+            count as count_twos
+        FROM grade_counts
+        WHERE grade = 2 AND count > 3
+        ORDER BY count_twos DESC, full_name
+    """, gt=3)
+
+@router.get("/less-than-5-twos")
+async def get_students_less_than_5_twos(request: Request):
+    """
+    Возвращает ФИО студентов, у которых оценка 2 встречается меньше 5 раз.
+    """
+    # Используем подзапрос для подсчета двоек у каждого студента
+    return students_twos_response(request, "less-than-5-twos", """
+        WITH student_twos AS (
+            SELECT 
+                full_name,
+                SUM(CASE WHEN grade = 2 THEN count ELSE 0 END)::BIGINT as count_twos
+            FROM grade_counts
+            GROUP BY full_name
+        )
+        SELECT 
+            full_name,
+            count_twos
+        FROM student_twos
+        WHERE count_twos < 5
+        ORDER BY count_twos DESC, full_name
+    """, lt=5)
+
+
+@router.get("/approx/summary")
+async def get_approx_summary():
+    """
+    Приближенная сводка по данным на основе скетчей (без сканирования grades).
+    distinct_students — оценка HyperLogLog, distinct_students_error — стандартная относительная ошибка.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        cursor.execute("""
-            SELECT 
-                full_name,
-                COUNT(*) as count_twos
-            FROM grades
-            WHERE grade = 2
-            GROUP BY full_name
-            HAVING COUNT(*) > 3
-            ORDER BY count_twos DESC, full_name
-        """)
+        cms, hll = load_sketches(cursor)
         
-        results = cursor.fetchall()
+        if cms is None or hll is None:
+            raise HTTPException(status_code=404, detail="Скетчи еще не построены")
         
-        students = [
-            {
-                "full_name": row[0],
-                "count_twos": row[1]
-            }
-            for row in results
-        ]
-        
-        logger.info(f"Найдено студентов с более чем 3 двойками: {len(students)}")
-        return JSONResponse(content=students)
+        return JSONResponse(content={
+            "approximate": True,
+            "distinct_students": hll.estimate(),
+            "distinct_students_error": round(hll.relative_error, 6),
+            "total_records": cms.total
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Ошибка при получении данных (more-than-3-twos): {str(e)}")
+        logger.error(f"Ошибка при получении данных (approx/summary): {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка при получении данных: {str(e)}")
     finally:
         cursor.close()
         return_db_connection(conn)
 
-@router.get("/less-than-5-twos")
-async def get_students_less_than_5_twos():
+@router.get("/approx/grade-count")
+async def get_approx_grade_count(full_name: str = Query(...), grade: int = Query(2)):
     """
-    Возвращает ФИО студентов, у которых оценка 2 встречается меньше 5 раз.
+    Приближенное число оценок grade у студента на основе Count-Min Sketch.
+    Оценка не меньше точного значения и с вероятностью confidence
+    превышает его не более чем на max_overestimate.
     """
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        # Используем подзапрос для подсчета двоек у каждого студента
-        cursor.execute("""
-            WITH student_twos AS (
-                SELECT 
-                    full_name,
-                    COUNT(CASE WHEN grade = 2 THEN 1 END) as count_twos
-                FROM grades
-                GROUP BY full_name
-            )
-            SELECT 
-                full_name,
-                count_twos
-            FROM student_twos
-            WHERE count_twos < 5
-            ORDER BY count_twos DESC, full_name
-        """)
-        
-        results = cursor.fetchall()
+        cms, _ = load_sketches(cursor)
         
-        students = [
-            {
-                "full_name": row[0],
-                "count_twos": row[1]
-            }
-            for row in results
-        ]
+        if cms is None:
+            raise HTTPException(status_code=404, detail="Скетчи еще не построены")
         
-        logger.info(f"Найдено студентов с менее чем 5 двойками: {len(students)}")
-        return JSONResponse(content=students)
+        return JSONResponse(content={
+            "approximate": True,
+            "full_name": full_name,
+            "grade": grade,
+            "count_estimate": cms.estimate(grade_key(full_name, grade)),
+            "max_overestimate": cms.error_bound(),
+            "confidence": round(1 - cms.delta, 6)
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Ошибка при получении данных (less-than-5-twos): {str(e)}")
+        logger.error(f"Ошибка при получении данных (approx/grade-count): {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка при получении данных: {str(e)}")
     finally:
         cursor.close()
         return_db_connection(conn)
-
-
@@ -1,10 +1,20 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
 from fastapi.responses import JSONResponse
 import csv
-import io
 import logging
+from collections import Counter
 from app.db.connection import get_db_connection, return_db_connection
 from app.config import validation_config
+from app.analytics.sketches import update_sketches
+from app.analytics.engine import analytics_engine, engine_enabled
+from app.db.data_version import bump_data_version
+from app.ingest.encoding import (
+    PREFIX_SAMPLE_SIZE, LineTooLongError, file_size, read_samples, detect_encoding, detect_delimiter,
+    iter_decoded_lines
+)
+from app.ingest.compression import CompressedInputError, detect_compression, open_stream
+from app.ingest.errors import ErrorCollector
+from app.api.request_decompression import is_request_decompressed
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -33,15 +43,120 @@ def validate_grade(grade_str: str) -> tuple[bool, str, int]:
     except ValueError:
         return False, "Оценка должна быть целым числом", 0
 
+def insert_batch(cursor, batch_data: list[tuple[str, int]]):
+    """Batch-вставка строк (full_name, grade)"""
+    cursor.executemany("""
+        INSERT INTO grades (full_name, grade)
+        VALUES (%s, %s)
+    """, batch_data)
+
+def load_csv_rows(cursor, lines, delimiter: str):
+    """
+    Парсинг, валидация и вставка строк CSV в текущей транзакции.
+    Возвращает (records_loaded, students_set, grade_counts, errors).
+    UnicodeDecodeError из потока строк пробрасывается вызывающему коду.
+    Если среди первых EARLY_ABORT_ROWS строк доля ошибочных превышает
+    EARLY_ABORT_INVALID_PERCENT, файл отклоняется без разбора остальных строк.
+    """
+    csv_reader = csv.DictReader(lines, delimiter=delimiter)
+    
+    # Валидация заголовков (используем названия полей из конфигурации)
+    expected_headers = validation_config.get_required_fields()
+    csv_fieldnames = set(csv_reader.fieldnames or [])
+    
+    if not expected_headers.issubset(csv_fieldnames):
+        missing_fields = expected_headers - csv_fieldnames
+        raise HTTPException(
+            status_code=400,
+            detail=f"CSV должен содержать обязательные заголовки: {', '.join(sorted(missing_fields))}"
+        )
+    
+    records_loaded = 0
+    students_set = set()
+    # Количество оценок по парам (студент, оценка) для обновления скетчей
+    grade_counts = Counter()
+    errors = ErrorCollector(validation_config.ERROR_DETAILS_LIMIT, validation_config.ERROR_SAMPLE_ROWS)
+    total_rows = 0
+    
+    # Используем batch insert для оптимизации
+    batch_data = []
+    
+    for row_num, row in enumerate(csv_reader, start=2):  # Начинаем с 2, т.к. 1 строка - заголовки
+        # Ранний отказ: проверяем долю ошибок, как только разобраны первые EARLY_ABORT_ROWS строк
+        if total_rows == validation_config.EARLY_ABORT_ROWS and errors.invalid_ratio_exceeded(
+            total_rows, validation_config.EARLY_ABORT_INVALID_PERCENT
+        ):
+            counts_str = ", ".join(f"{error_type}: {count}" for error_type, count in errors.counts.most_common())
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"Файл отклонен: {errors.total} ошибочных строк из первых {total_rows} "
+                    f"(допустимо не более {validation_config.EARLY_ABORT_INVALID_PERCENT:g}%; {counts_str}). "
+                    f"Ошибки: {errors.describe(10)}"
+                )
+            )
+        
+        total_rows += 1
+        
+        # Проверка максимального количества строк
+        if total_rows > validation_config.MAX_ROWS:
+            errors.add(row_num, "max_rows", f"Превышено максимальное количество строк ({validation_config.MAX_ROWS})")
+            break
+        
+        try:
+            # Получение значений из строки (используем названия полей из конфигурации)
+            full_name_raw = row.get(validation_config.CSV_FIELD_FULL_NAME, '').strip()
+            grade_str_raw = row.get(validation_config.CSV_FIELD_GRADE, '').strip()
+            
+            # Валидация ФИО
+            is_valid_name, name_error = validate_full_name(full_name_raw)
+            if not is_valid_name:
+                errors.add(row_num, "full_name", name_error)
+                continue
+            full_name = full_name_raw
+            
+            # Валидация оценки
+            is_valid_grade, grade_error, grade = validate_grade(grade_str_raw)
+            if not is_valid_grade:
+                errors.add(row_num, "grade", grade_error)
+                continue
+            
+            # Добавляем в batch
+            batch_data.append((full_name, grade))
+            students_set.add(full_name)
+            grade_counts[(full_name, grade)] += 1
+            
+            # Выполняем batch insert при достижении размера батча
+            if len(batch_data) >= validation_config.BATCH_SIZE:
+                insert_batch(cursor, batch_data)
+                records_loaded += len(batch_data)
+                batch_data = []
+            
+        except KeyError as e:
+            errors.add(row_num, "missing_field", f"отсутствует обязательное поле {str(e)}")
+            continue
+        except Exception as e:
+            errors.add(row_num, "row", str(e))
+            continue
+    
+    # Вставляем оставшиеся данные
+    if batch_data:
+        insert_batch(cursor, batch_data)
+        records_loaded += len(batch_data)
+    
+    return records_loaded, students_set, grade_counts, errors
+
 @router.post("/upload-grades")
-async def upload_grades(file: UploadFile = File(...)):
+async def upload_grades(request: Request, file: UploadFile = File(...)):
     """
     Загрузка CSV-файла с успеваемостью студентов.
     Ожидаемый формат CSV: {CSV_FIELD_FULL_NAME},{CSV_FIELD_GRADE}
     
     Валидация (параметры настраиваются через .env или app/config.py):
-    - Файл должен быть в формате CSV
-    - Максимальный размер файла: {MAX_FILE_SIZE_MB} МБ
+    - Файл должен быть в формате CSV, допускается сжатие gzip (.csv.gz) и zstd (.csv.zst)
+    - Максимальный размер файла: {MAX_FILE_SIZE_MB} МБ (для запроса, сжатого целиком, — размер
+      сжатого тела, а распакованный файл ограничен {MAX_DECOMPRESSED_SIZE_MB} МБ)
+    - Максимальный размер распакованного файла: {MAX_DECOMPRESSED_SIZE_MB} МБ
     - Максимальное количество строк: {MAX_ROWS}
     - Обязательные поля: {CSV_FIELDS}
     - ФИО ({CSV_FIELD_FULL_NAME}): не пустое, минимум {FULL_NAME_MIN_LENGTH} символа, максимум {FULL_NAME_MAX_LENGTH} символов
@@ -51,146 +166,96 @@ async def upload_grades(file: UploadFile = File(...)):
         CSV_FIELD_GRADE=validation_config.CSV_FIELD_GRADE,
         CSV_FIELDS=", ".join(sorted(validation_config.get_required_fields())),
         MAX_FILE_SIZE_MB=validation_config.MAX_FILE_SIZE_MB,
+        MAX_DECOMPRESSED_SIZE_MB=validation_config.MAX_DECOMPRESSED_SIZE_MB,
         MAX_ROWS=validation_config.MAX_ROWS,
         FULL_NAME_MIN_LENGTH=validation_config.FULL_NAME_MIN_LENGTH,
         FULL_NAME_MAX_LENGTH=validation_config.FULL_NAME_MAX_LENGTH,
         VALID_GRADES=", ".join(map(str, validation_config.VALID_GRADES))
     )
     # Проверка расширения файла
-    if not file.filename or not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Файл должен быть в формате CSV")
+    if not file.filename or not file.filename.lower().endswith(validation_config.SUPPORTED_FILE_EXTENSIONS):
+        extensions_str = ", ".join(validation_config.SUPPORTED_FILE_EXTENSIONS)
+        raise HTTPException(status_code=400, detail=f"Файл должен быть в формате CSV ({extensions_str})")
     
     try:
-        # Чтение содержимого файла
-        contents = await file.read()
-        
-        # Проверка размера файла
-        if len(contents) > validation_config.MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Размер файла превышает максимально допустимый ({validation_config.MAX_FILE_SIZE_MB} МБ)"
-            )
-        
-        # Декодирование содержимого
-        # Попытка декодировать файл в поддерживаемых кодировках
-        csv_content = None
-        for encoding in validation_config.SUPPORTED_ENCODINGS:
-            try:
-                csv_content = contents.decode(encoding)
-                break
-            except UnicodeDecodeError:
-                continue
+        # Файл не читается в память целиком: работаем с его потоком
+        raw = file.file
+        size = file_size(raw)
         
-        if csv_content is None:
-            encodings_str = " или ".join(validation_config.SUPPORTED_ENCODINGS)
+        # Проверка размера файла (для сжатых файлов — размера архива). Если сжат был весь запрос,
+        # передаваемый объем уже проверен middleware, а файл получен распакованным
+        if is_request_decompressed(request):
+            max_size, max_size_mb = validation_config.MAX_DECOMPRESSED_SIZE, validation_config.MAX_DECOMPRESSED_SIZE_MB
+        else:
+            max_size, max_size_mb = validation_config.MAX_FILE_SIZE, validation_config.MAX_FILE_SIZE_MB
+        if size > max_size:
             raise HTTPException(
                 status_code=400,
-                detail=f"Файл должен быть в кодировке {encodings_str}"
+                detail=f"Размер файла превышает максимально допустимый ({max_size_mb} МБ)"
             )
         
-        # Автоопределение разделителя CSV
-        sniffer = csv.Sniffer()
-        sample = csv_content[:1024]  # Берем первые 1024 символа для анализа
-        try:
-            dialect = sniffer.sniff(sample, delimiters=',;\t')
-            delimiter = dialect.delimiter
-            logger.info(f"Определен разделитель CSV: '{delimiter}'")
-        except csv.Error:
-            # Если не удалось определить, используем запятую по умолчанию
-            delimiter = ','
-            logger.warning(f"Не удалось автоматически определить разделитель, используется запятая")
+        # Определение сжатия по сигнатуре файла
+        head = raw.read(4)
+        compression = detect_compression(file.filename, file.headers.get("content-encoding"), head)
         
-        csv_reader = csv.DictReader(io.StringIO(csv_content), delimiter=delimiter)
+        def open_data_stream():
+            return open_stream(raw, compression, validation_config.MAX_DECOMPRESSED_SIZE)
         
-        # Валидация заголовков (используем названия полей из конфигурации)
-        expected_headers = validation_config.get_required_fields()
-        csv_fieldnames = set(csv_reader.fieldnames or [])
+        # Определение кодировки и разделителя по выборке из файла.
+        # Сжатый поток нельзя читать с произвольной позиции, поэтому для него берется только начало
+        if compression is None:
+            prefix, blocks = read_samples(raw, size)
+        else:
+            prefix, blocks = open_data_stream().read(PREFIX_SAMPLE_SIZE), []
+        encoding, fallback_encodings = detect_encoding(prefix, blocks, validation_config.SUPPORTED_ENCODINGS)
         
-        if not expected_headers.issubset(csv_fieldnames):
-            missing_fields = expected_headers - csv_fieldnames
+        encodings_str = " или ".join(validation_config.SUPPORTED_ENCODINGS)
+        if encoding is None:
             raise HTTPException(
                 status_code=400,
-                detail=f"CSV должен содержать обязательные заголовки: {', '.join(sorted(missing_fields))}"
+                detail=f"Файл должен быть в кодировке {encodings_str}"
             )
         
+        delimiter = detect_delimiter(prefix, encoding)
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        records_loaded = 0
-        students_set = set()
-        errors = []
-        total_rows = 0
-        
         try:
-            # Используем batch insert для оптимизации
-            batch_data = []
-            
-            for row_num, row in enumerate(csv_reader, start=2):  # Начинаем с 2, т.к. 1 строка - заголовки
-                total_rows += 1
-                
-                # Проверка максимального количества строк
-                if total_rows > validation_config.MAX_ROWS:
-                    errors.append(f"Превышено максимальное количество строк ({validation_config.MAX_ROWS})")
-                    break
-                
+            # Файл декодируется один раз потоково. Если выборка ошиблась и поток
+            # не декодируется, откатываем вставленное и повторяем со следующей кодировкой
+            for current_encoding in [encoding] + fallback_encodings:
                 try:
-                    # Получение значений из строки (используем названия полей из конфигурации)
-                    full_name_raw = row.get(validation_config.CSV_FIELD_FULL_NAME, '').strip()
-                    grade_str_raw = row.get(validation_config.CSV_FIELD_GRADE, '').strip()
-                    
-                    # Валидация ФИО
-                    is_valid_name, name_error = validate_full_name(full_name_raw)
-                    if not is_valid_name:
-                        errors.append(f"Строка {row_num}: {name_error}")
-                        continue
-                    full_name = full_name_raw
-                    
-                    # Валидация оценки
-                    is_valid_grade, grade_error, grade = validate_grade(grade_str_raw)
-                    if not is_valid_grade:
-                        errors.append(f"Строка {row_num}: {grade_error}")
-                        continue
-                    
-                    # Добавляем в batch
-                    batch_data.append((full_name, grade))
-                    students_set.add(full_name)
-                    
-                    # Выполняем batch insert при достижении размера батча
-                    if len(batch_data) >= validation_config.BATCH_SIZE:
-                        cursor.executemany("""
-                            INSERT INTO grades (full_name, grade)
-                            VALUES (%s, %s)
-                        """, batch_data)
-                        records_loaded += len(batch_data)
-                        batch_data = []
-                    
-                except KeyError as e:
-                    errors.append(f"Строка {row_num}: отсутствует обязательное поле {str(e)}")
-                    continue
-                except Exception as e:
-                    errors.append(f"Строка {row_num}: {str(e)}")
-                    continue
+                    records_loaded, students_set, grade_counts, errors = load_csv_rows(
+                        cursor, iter_decoded_lines(open_data_stream(), current_encoding), delimiter
+                    )
+                    break
+                except UnicodeDecodeError as e:
+                    conn.rollback()
+                    logger.warning(f"Файл не декодируется как {current_encoding} ({e.reason}), повтор со следующей кодировкой")
+            else:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Файл должен быть в кодировке {encodings_str}"
+                )
             
-            # Вставляем оставшиеся данные
-            if batch_data:
-                cursor.executemany("""
-                    INSERT INTO grades (full_name, grade)
-                    VALUES (%s, %s)
-                """, batch_data)
-                records_loaded += len(batch_data)
+            # Скетчи и версия данных обновляются в той же транзакции, что и данные
+            if grade_counts:
+                update_sketches(cursor, grade_counts)
+                data_version = bump_data_version(cursor)
             
             conn.commit()
             
+            if grade_counts and engine_enabled():
+                analytics_engine.apply(grade_counts, data_version)
+            
             logger.info(f"Загружено записей: {records_loaded}, уникальных студентов: {len(students_set)}")
             
             # Если не удалось загрузить ни одной записи
             if records_loaded == 0:
                 error_message = "Не удалось загрузить данные"
                 if errors:
-                    error_details = '; '.join(errors[:10])
-                    if len(errors) > 10:
-                        error_details += f" (и еще {len(errors) - 10} ошибок)"
-                    error_message += f". Ошибки: {error_details}"
+                    error_message += f". Ошибки: {errors.describe(10)}"
                 logger.error(f"Загрузка CSV не удалась: {error_message}")
                 raise HTTPException(status_code=400, detail=error_message)
             
@@ -202,8 +267,9 @@ async def upload_grades(file: UploadFile = File(...)):
             
             if errors:
                 response["warnings"] = f"Обнаружено {len(errors)} ошибок при обработке"
-                if len(errors) <= 20:
-                    response["error_details"] = errors[:20]
+                # Первые ERROR_DETAILS_LIMIT ошибок подробно, остальные — счетчиками по типам
+                response["error_details"] = errors.details
+                response["error_summary"] = errors.summary()
                 logger.warning(f"Загрузка завершена с {len(errors)} ошибками")
                 logger.warning(f"CSV загружен с предупреждениями: {len(errors)} ошибок")
             else:
@@ -211,6 +277,9 @@ async def upload_grades(file: UploadFile = File(...)):
             
             return JSONResponse(content=response)
             
+        except (HTTPException, CompressedInputError, LineTooLongError):
+            conn.rollback()
+            raise
         except Exception as e:
             conn.rollback()
             raise HTTPException(status_code=500, detail=f"Ошибка при загрузке данных: {str(e)}")
@@ -220,6 +289,7 @@ async def upload_grades(file: UploadFile = File(...)):
             
     except HTTPException:
         raise
+    except (CompressedInputError, LineTooLongError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при обработке файла: {str(e)}")
-
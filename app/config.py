@@ -15,12 +15,25 @@ class ValidationConfig:
     MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "10"))
     MAX_FILE_SIZE = MAX_FILE_SIZE_MB * 1024 * 1024
     
+    # Размер распакованного содержимого сжатых файлов (.csv.gz, .csv.zst)
+    MAX_DECOMPRESSED_SIZE_MB = int(os.getenv("MAX_DECOMPRESSED_SIZE_MB", "100"))
+    MAX_DECOMPRESSED_SIZE = MAX_DECOMPRESSED_SIZE_MB * 1024 * 1024
+    
     # Максимальное количество строк в файле
     MAX_ROWS = int(os.getenv("MAX_ROWS", "100000"))
     
     # Размер батча для вставки в БД
     BATCH_SIZE = int(os.getenv("BATCH_SIZE", "1000"))
     
+    # Сколько ошибок строк возвращать подробно и сколько номеров строк-примеров хранить на тип ошибки
+    ERROR_DETAILS_LIMIT = int(os.getenv("ERROR_DETAILS_LIMIT", "20"))
+    ERROR_SAMPLE_ROWS = int(os.getenv("ERROR_SAMPLE_ROWS", "5"))
+    
+    # Ранний отказ: файл отклоняется, если среди первых EARLY_ABORT_ROWS строк
+    # ошибочных больше EARLY_ABORT_INVALID_PERCENT процентов (0 строк — проверка отключена)
+    EARLY_ABORT_ROWS = int(os.getenv("EARLY_ABORT_ROWS", "1000"))
+    EARLY_ABORT_INVALID_PERCENT = float(os.getenv("EARLY_ABORT_INVALID_PERCENT", "50"))
+    
     # Валидация ФИО
     FULL_NAME_MIN_LENGTH = int(os.getenv("FULL_NAME_MIN_LENGTH", "2"))
     FULL_NAME_MAX_LENGTH = int(os.getenv("FULL_NAME_MAX_LENGTH", "255"))
@@ -32,6 +45,9 @@ class ValidationConfig:
     # Поддерживаемые кодировки файлов
     SUPPORTED_ENCODINGS = ["utf-8", "windows-1251"]
     
+    # Допустимые расширения файлов (несжатый и сжатые CSV)
+    SUPPORTED_FILE_EXTENSIONS = (".csv", ".csv.gz", ".csv.zst")
+    
     # Названия полей CSV (можно переопределить через переменные окружения)
     CSV_FIELD_FULL_NAME = os.getenv("CSV_FIELD_FULL_NAME", "full_name")
     CSV_FIELD_GRADE = os.getenv("CSV_FIELD_GRADE", "grade")
@@ -56,9 +72,21 @@ class ValidationConfig:
         if cls.MAX_FILE_SIZE_MB <= 0:
             errors.append("MAX_FILE_SIZE_MB должен быть больше 0")
         
+        if cls.MAX_DECOMPRESSED_SIZE_MB <= 0:
+            errors.append("MAX_DECOMPRESSED_SIZE_MB должен быть больше 0")
+        
         if cls.MAX_ROWS <= 0:
             errors.append("MAX_ROWS должен быть больше 0")
         
+        if cls.ERROR_DETAILS_LIMIT < 0 or cls.ERROR_SAMPLE_ROWS < 0:
+            errors.append("ERROR_DETAILS_LIMIT и ERROR_SAMPLE_ROWS должны быть >= 0")
+        
+        if cls.EARLY_ABORT_ROWS < 0:
+            errors.append("EARLY_ABORT_ROWS должен быть >= 0")
+        
+        if not 0 <= cls.EARLY_ABORT_INVALID_PERCENT <= 100:
+            errors.append("EARLY_ABORT_INVALID_PERCENT должен быть в диапазоне от 0 до 100")
+        
         if cls.FULL_NAME_MIN_LENGTH < 1:
             errors.append("FULL_NAME_MIN_LENGTH должен быть >= 1")
         
@@ -87,9 +115,119 @@ class ValidationConfig:
         return True
 
 
-# Создаем экземпляр конфигурации
+class AnalyticsConfig:
+    """Конфигурация аналитики (приближенный режим на скетчах)"""
+    
+    # Count-Min Sketch: относительная погрешность (доля от общего числа записей)
+    # и вероятность ее превышения
+    SKETCH_CMS_EPSILON = float(os.getenv("SKETCH_CMS_EPSILON", "0.001"))
+    SKETCH_CMS_DELTA = float(os.getenv("SKETCH_CMS_DELTA", "0.01"))
+    
+    # HyperLogLog: точность (число регистров = 2^precision)
+    SKETCH_HLL_PRECISION = int(os.getenv("SKETCH_HLL_PRECISION", "14"))
+    
+    # In-process аналитический движок (только для запуска с одним воркером)
+    ANALYTICS_ENGINE_ENABLED = os.getenv("ANALYTICS_ENGINE_ENABLED", "false").lower() in ("1", "true", "yes")
+    
+    @classmethod
+    def validate(cls):
+        """Валидация конфигурации при старте приложения"""
+        errors = []
+        
+        if not 0 < cls.SKETCH_CMS_EPSILON < 1:
+            errors.append("SKETCH_CMS_EPSILON должен быть в интервале (0, 1)")
+        
+        if not 0 < cls.SKETCH_CMS_DELTA < 1:
+            errors.append("SKETCH_CMS_DELTA должен быть в интервале (0, 1)")
+        
+        if not 4 <= cls.SKETCH_HLL_PRECISION <= 18:
+            errors.append("SKETCH_HLL_PRECISION должен быть в диапазоне от 4 до 18")
+        
+        if errors:
+            raise ValueError(f"Ошибки конфигурации аналитики: {'; '.join(errors)}")
+        
+        return True
+
+
+class ProfilingConfig:
+    """Конфигурация профилирования SQL-запросов и отладочных эндпоинтов"""
+    
+    # Замер длительности каждого SQL-запроса
+    QUERY_PROFILING_ENABLED = os.getenv("QUERY_PROFILING_ENABLED", "true").lower() in ("1", "true", "yes")
+    
+    # Порог медленного запроса в миллисекундах
+    SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+    
+    # Доля медленных запросов, для которых выполняется EXPLAIN ANALYZE (запрос выполняется повторно)
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0.1"))
+    
+    # Сколько последних медленных запросов хранить для /debug/slow-queries
+    SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "100"))
+    
+    # Отладочные эндпоинты раскрывают тексты запросов, поэтому по умолчанию выключены
+    DEBUG_ENDPOINTS_ENABLED = os.getenv("DEBUG_ENDPOINTS_ENABLED", "false").lower() in ("1", "true", "yes")
+    
+    @classmethod
+    def validate(cls):
+        """Валидация конфигурации при старте приложения"""
+        errors = []
+        
+        if cls.SLOW_QUERY_THRESHOLD_MS < 0:
+            errors.append("SLOW_QUERY_THRESHOLD_MS должен быть >= 0")
+        
+        if not 0 <= cls.SLOW_QUERY_EXPLAIN_SAMPLE_RATE <= 1:
+            errors.append("SLOW_QUERY_EXPLAIN_SAMPLE_RATE должен быть в диапазоне от 0 до 1")
+        
+        if cls.SLOW_QUERY_BUFFER_SIZE <= 0:
+            errors.append("SLOW_QUERY_BUFFER_SIZE должен быть больше 0")
+        
+        if errors:
+            raise ValueError(f"Ошибки конфигурации профилирования: {'; '.join(errors)}")
+        
+        return True
+
+
+class CompactionConfig:
+    """Конфигурация компактизации таблицы grades"""
+    
+    # Строки старше этого числа дней сворачиваются в grade_rollups
+    GRADES_RETENTION_DAYS = int(os.getenv("GRADES_RETENTION_DAYS", "90"))
+    
+    # Число строк grades, переносимых одной транзакцией
+    COMPACTION_BATCH_SIZE = int(os.getenv("COMPACTION_BATCH_SIZE", "10000"))
+    
+    # Период фоновой компактизации в приложении, 0 — отключена (запуск только через compact.py)
+    COMPACTION_INTERVAL_HOURS = float(os.getenv("COMPACTION_INTERVAL_HOURS", "0"))
+    
+    @classmethod
+    def validate(cls):
+        """Валидация конфигурации при старте приложения"""
+        errors = []
+        
+        if cls.GRADES_RETENTION_DAYS < 0:
+            errors.append("GRADES_RETENTION_DAYS должен быть >= 0")
+        
+        if cls.COMPACTION_BATCH_SIZE <= 0:
+            errors.append("COMPACTION_BATCH_SIZE должен быть больше 0")
+        
+        if cls.COMPACTION_INTERVAL_HOURS < 0:
+            errors.append("COMPACTION_INTERVAL_HOURS должен быть >= 0")
+        
+        if errors:
+            raise ValueError(f"Ошибки конфигурации компактизации: {'; '.join(errors)}")
+        
+        return True
+
+
+# Создаем экземпляры конфигурации
 validation_config = ValidationConfig()
+analytics_config = AnalyticsConfig()
+profiling_config = ProfilingConfig()
+compaction_config = CompactionConfig()
 
 # Валидируем при импорте
 validation_config.validate()
+analytics_config.validate()
+profiling_config.validate()
+compaction_config.validate()
 
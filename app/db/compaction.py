@@ -0,0 +1,130 @@
+"""
+Компактизация таблицы grades.
+
+Строки старше срока хранения переносятся в свертки grade_rollups (число оценок
+каждого вида у студента) и удаляются из grades порциями, каждая порция в своей
+транзакции. Перенос порции выполняется одним оператором, поэтому представление
+grade_counts (свертки плюс оставшиеся строки) в любой момент дает точные счетчики
+и версия данных не меняется. Параметры задаются в CompactionConfig (app/config.py).
+"""
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+from app.config import compaction_config
+from app.db.connection import create_db_connection
+
+logger = logging.getLogger(__name__)
+
+# SKIP LOCKED: параллельные запуски (несколько воркеров или compact.py) не ждут друг друга
+_COMPACT_BATCH_SQL = """
+    WITH moved AS (
+        DELETE FROM grades
+        WHERE id IN (
+            SELECT id FROM grades
+            WHERE created_at < %s
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING full_name, grade
+    ), folded AS (
+        INSERT INTO grade_rollups (full_name, grade, count)
+        SELECT full_name, grade, COUNT(*)
+        FROM moved
+        GROUP BY full_name, grade
+        ON CONFLICT (full_name, grade) DO UPDATE
+        SET count = grade_rollups.count + EXCLUDED.count,
+            updated_at = CURRENT_TIMESTAMP
+    )
+    SELECT COUNT(*) FROM moved
+"""
+
+
+def compaction_cutoff(cursor, retention_days: int) -> datetime:
+    """Граница компактизации: строки с created_at раньше нее сворачиваются"""
+    cursor.execute("SELECT LOCALTIMESTAMP - %s * INTERVAL '1 day'", (retention_days,))
+    return cursor.fetchone()[0]
+
+
+def compact_grades(
+    conn,
+    retention_days: int = compaction_config.GRADES_RETENTION_DAYS,
+    batch_size: int = compaction_config.COMPACTION_BATCH_SIZE,
+    stop: Optional[threading.Event] = None
+) -> int:
+    """
+    Свертка строк grades старше retention_days дней в grade_rollups.
+    Граница фиксируется при запуске, поэтому задача завершается и при
+    непрерывных загрузках; stop позволяет прервать ее между порциями.
+    Возвращает число перенесенных строк.
+    """
+    if retention_days < 0:
+        raise ValueError("Срок хранения не может быть отрицательным")
+    if batch_size <= 0:
+        raise ValueError("Размер порции должен быть положительным")
+
+    cursor = conn.cursor()
+    total = 0
+    batches = 0
+
+    try:
+        cutoff = compaction_cutoff(cursor, retention_days)
+        conn.commit()
+        logger.info(f"Компактизация строк grades старше {cutoff} порциями по {batch_size}")
+
+        while stop is None or not stop.is_set():
+            cursor.execute(_COMPACT_BATCH_SQL, (cutoff, batch_size))
+            moved = cursor.fetchone()[0]
+            conn.commit()
+            if moved == 0:
+                break
+            total += moved
+            batches += 1
+            logger.debug(f"Порция {batches}: перенесено строк {moved}")
+
+        logger.info(f"Компактизация завершена: перенесено строк {total}, порций {batches}")
+        return total
+
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Ошибка компактизации (перенесено строк до ошибки: {total}): {e}")
+        raise
+    finally:
+        cursor.close()
+
+
+def vacuum_grades(conn):
+    """VACUUM ANALYZE grades: место удаленных строк становится доступным для новых, статистика обновляется"""
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        cursor.execute("VACUUM (ANALYZE) grades")
+    finally:
+        cursor.close()
+        conn.autocommit = False
+
+
+def _compact_with_own_connection(stop: threading.Event) -> int:
+    # Пул соединений не потокобезопасен, поэтому в потоке используется отдельное соединение
+    conn = create_db_connection()
+    try:
+        return compact_grades(conn, stop=stop)
+    finally:
+        conn.close()
+
+
+async def run_compaction_periodically(interval_hours: float):
+    """Фоновая компактизация раз в interval_hours часов (задача отменяется при остановке приложения)"""
+    stop = threading.Event()
+    try:
+        while True:
+            await asyncio.sleep(interval_hours * 3600)
+            try:
+                await asyncio.to_thread(_compact_with_own_connection, stop)
+            except Exception as e:
+                # Ошибка уже залогирована, следующая попытка — в следующем периоде
+                logger.warning(f"Фоновая компактизация не выполнена: {e}")
+    finally:
+        # Поток нельзя отменить, он завершится после текущей порции
+        stop.set()
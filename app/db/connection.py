@@ -3,6 +3,7 @@ from psycopg2 import pool
 import os
 import logging
 from dotenv import load_dotenv
+from app.db.profiling import ProfilingCursor
 
 load_dotenv()
 
@@ -34,7 +35,7 @@ def init_db_pool():
             logger.info(f"Параметры подключения: host={DB_CONFIG['host']}, port={DB_CONFIG['port']}, db={DB_CONFIG['database']}, user={DB_CONFIG['user']}")
             
             connection_pool = psycopg2.pool.SimpleConnectionPool(
-                1, 20, **DB_CONFIG
+                1, 20, **DB_CONFIG, cursor_factory=ProfilingCursor
             )
             if connection_pool:
                 logger.info("Пул соединений с БД успешно создан")
@@ -53,7 +54,11 @@ def get_db_connection():
     if connection_pool:
         return connection_pool.getconn()
     else:
-        return psycopg2.connect(**DB_CONFIG)
+        return create_db_connection()
+
+def create_db_connection():
+    """Отдельное соединение вне пула (пул не потокобезопасен, для фоновых задач в других потоках)"""
+    return psycopg2.connect(**DB_CONFIG, cursor_factory=ProfilingCursor)
 
 def return_db_connection(conn):
     """Возврат соединения в пул"""
@@ -0,0 +1,34 @@
+"""
+Версия данных таблицы grades.
+Увеличивается при каждой успешной загрузке и используется для ETag / Last-Modified
+аналитических эндпоинтов и для кеширования их ответов.
+"""
+from datetime import datetime
+
+
+def get_data_version(cursor) -> tuple[int, datetime]:
+    """Текущая версия данных и время ее изменения"""
+    cursor.execute("SELECT version, updated_at FROM data_version WHERE id = 1")
+    return cursor.fetchone()
+
+
+def bump_data_version(cursor) -> tuple[int, datetime]:
+    """
+    Увеличение версии данных в текущей транзакции.
+    Строка блокируется до конца транзакции, поэтому версии параллельных загрузок не совпадают.
+    Время изменения хранится с точностью до секунды (как в Last-Modified) и растет
+    не меньше чем на секунду с каждой версией: иначе две загрузки в одну секунду дали бы
+    одинаковый Last-Modified, и клиент с одним If-Modified-Since получал бы устаревший 304.
+    При частых загрузках время может опережать часы, пока загрузки не станут реже.
+    """
+    cursor.execute("""
+        UPDATE data_version
+        SET version = version + 1,
+            updated_at = GREATEST(
+                date_trunc('second', clock_timestamp()),
+                date_trunc('second', updated_at) + INTERVAL '1 second'
+            )
+        WHERE id = 1
+        RETURNING version, updated_at
+    """)
+    return cursor.fetchone()
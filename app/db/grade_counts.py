@@ -0,0 +1,25 @@
+"""
+Чтение счетчиков оценок из представления grade_counts (свертки и строки grades).
+"""
+from typing import Iterator
+
+# Число строк, получаемых серверным курсором за одно обращение к БД
+GRADE_COUNTS_ITERSIZE = 10000
+
+
+def iter_grade_counts(conn, cursor_name: str) -> Iterator[tuple[str, int, int]]:
+    """
+    Строки (full_name, grade, count) представления grade_counts в текущей транзакции conn.
+    Серверный курсор, чтобы не держать весь результат агрегации в памяти;
+    курсор закрывается, когда строки прочитаны до конца.
+    """
+    cursor = conn.cursor(name=cursor_name)
+    try:
+        cursor.itersize = GRADE_COUNTS_ITERSIZE
+        cursor.execute("""
+            SELECT full_name, grade, count
+            FROM grade_counts
+        """)
+        yield from cursor
+    finally:
+        cursor.close()
@@ -1,10 +1,25 @@
 """
 Система миграций базы данных.
 Применяет SQL-скрипты из папки migrations/ в порядке их версий.
+
+Виды миграций (задаются директивами в комментариях в начале файла):
+
+- обычная — весь файл выполняется в одной транзакции;
+- без транзакции (`-- migration: no-transaction` или имя `*.notx.sql`) —
+  операторы выполняются по одному в autocommit, например CREATE INDEX CONCURRENTLY;
+- backfill (`-- migration: backfill`) — SQL выполняется порциями по диапазонам ключа
+  `%(start)s < key <= %(end)s`, каждая порция в своей транзакции, прогресс
+  сохраняется в schema_migrations.checkpoint, прерванная миграция продолжается с него.
+
+Для всех миграций задаются lock_timeout и statement_timeout, чтобы миграция
+не блокировала запись надолго; при таймауте блокировки операция повторяется.
 """
 import os
+import re
+import time
 import logging
 from pathlib import Path
+from psycopg2 import errors as pg_errors
 from app.db.connection import get_db_connection, return_db_connection
 
 logger = logging.getLogger(__name__)
@@ -12,6 +27,136 @@ logger = logging.getLogger(__name__)
 # Путь к папке с миграциями
 MIGRATIONS_DIR = Path(__file__).parent.parent.parent / "migrations"
 
+# Таймауты по умолчанию (формат PostgreSQL: '5s', '1min', '0' — без ограничения)
+MIGRATION_LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+MIGRATION_STATEMENT_TIMEOUT = os.getenv("MIGRATION_STATEMENT_TIMEOUT", "0")
+
+# Повторы при таймауте ожидания блокировки
+MIGRATION_LOCK_RETRIES = int(os.getenv("MIGRATION_LOCK_RETRIES", "5"))
+MIGRATION_LOCK_RETRY_DELAY = float(os.getenv("MIGRATION_LOCK_RETRY_DELAY", "2"))
+
+# Выполнять ли backfill-миграции при старте приложения. По умолчанию нет: до окончания
+# порционного прохода по большой таблице приложение не принимает запросы, поэтому
+# применение при старте останавливается на первой из них до запуска migrate.py
+MIGRATIONS_RUN_BACKFILLS_ON_STARTUP = os.getenv("MIGRATIONS_RUN_BACKFILLS_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+MODE_TRANSACTIONAL = "transactional"
+MODE_NO_TRANSACTION = "no-transaction"
+MODE_BACKFILL = "backfill"
+
+_DIRECTIVE_RE = re.compile(r"^--\s*([\w-]+)\s*:\s*(.+?)\s*$")
+
+
+def parse_migration_options(file_path: Path, sql: str) -> dict:
+    """Директивы миграции из комментариев вида `-- key: value` в начале файла"""
+    options = {
+        "migration": MODE_NO_TRANSACTION if file_path.name.endswith(".notx.sql") else MODE_TRANSACTIONAL,
+        "lock-timeout": MIGRATION_LOCK_TIMEOUT,
+        "statement-timeout": MIGRATION_STATEMENT_TIMEOUT,
+    }
+    for line in sql.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith("--"):
+            break
+        match = _DIRECTIVE_RE.match(line)
+        if match:
+            options[match.group(1).lower()] = match.group(2)
+    
+    if options["migration"] not in (MODE_TRANSACTIONAL, MODE_NO_TRANSACTION, MODE_BACKFILL):
+        raise ValueError(f"Неизвестный вид миграции {options['migration']} в {file_path.name}")
+    if options["migration"] == MODE_BACKFILL:
+        for key in ("backfill-table", "backfill-key"):
+            if key not in options:
+                raise ValueError(f"Backfill-миграция {file_path.name} должна задавать директиву {key}")
+        options["backfill-batch-size"] = int(options.get("backfill-batch-size", "10000"))
+    return options
+
+
+def split_sql_statements(sql: str) -> list[str]:
+    """
+    Разбиение SQL на отдельные операторы по ';'
+    с учетом строк, идентификаторов в кавычках, комментариев и $$-блоков.
+    """
+    statements = []
+    current = []
+    i = 0
+    length = len(sql)
+    while i < length:
+        char = sql[i]
+        if sql.startswith("--", i):
+            end = sql.find("\n", i)
+            end = length if end == -1 else end
+            current.append(sql[i:end])
+            i = end
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            end = length if end == -1 else end + 2
+            current.append(sql[i:end])
+            i = end
+        elif char in ("'", '"'):
+            end = i + 1
+            while end < length:
+                if sql[end] == char:
+                    # Удвоенная кавычка — экранирование внутри строки
+                    if end + 1 < length and sql[end + 1] == char:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+        elif char == "$":
+            match = re.match(r"\$[A-Za-z_]*\$", sql[i:])
+            if match:
+                tag = match.group(0)
+                end = sql.find(tag, i + len(tag))
+                end = length if end == -1 else end + len(tag)
+                current.append(sql[i:end])
+                i = end
+            else:
+                current.append(char)
+                i += 1
+        elif char == ";":
+            statements.append("".join(current))
+            current = []
+            i += 1
+        else:
+            current.append(char)
+            i += 1
+    statements.append("".join(current))
+    
+    # Отбрасываем пустые фрагменты и фрагменты из одних комментариев
+    result = []
+    for statement in statements:
+        code = re.sub(r"--[^\n]*|/\*.*?\*/", "", statement, flags=re.S).strip()
+        if code:
+            result.append(statement.strip())
+    return result
+
+
+def _with_lock_retries(description: str, func):
+    """Выполнение операции с повтором при таймауте ожидания блокировки"""
+    for attempt in range(MIGRATION_LOCK_RETRIES + 1):
+        try:
+            return func()
+        except pg_errors.LockNotAvailable:
+            if attempt == MIGRATION_LOCK_RETRIES:
+                raise
+            logger.warning(
+                f"Таймаут блокировки ({description}), повтор через {MIGRATION_LOCK_RETRY_DELAY} с "
+                f"(попытка {attempt + 1}/{MIGRATION_LOCK_RETRIES})"
+            )
+            time.sleep(MIGRATION_LOCK_RETRY_DELAY)
+
+
+def _set_timeouts(cursor, options: dict, local: bool):
+    """Установка lock_timeout и statement_timeout (SET LOCAL — только до конца транзакции)"""
+    scope = "SET LOCAL" if local else "SET"
+    cursor.execute(f"{scope} lock_timeout = %s", (options["lock-timeout"],))
+    cursor.execute(f"{scope} statement_timeout = %s", (options["statement-timeout"],))
+
 
 def init_schema_migrations():
     """Инициализация таблицы для отслеживания миграций"""
@@ -38,10 +183,10 @@ def get_applied_migrations():
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT version FROM schema_migrations ORDER BY version")
+        cursor.execute("SELECT version FROM schema_migrations WHERE completed ORDER BY version")
         applied = {row[0] for row in cursor.fetchall()}
         return applied
-    except Exception as e:
+    except Exception:
         # Если таблицы еще нет, возвращаем пустое множество
         return set()
     finally:
@@ -49,6 +194,20 @@ def get_applied_migrations():
         return_db_connection(conn)
 
 
+def get_backfills_in_progress():
+    """Незавершенные backfill-миграции: {version: checkpoint}"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT version, checkpoint FROM schema_migrations WHERE NOT completed ORDER BY version")
+        return dict(cursor.fetchall())
+    except Exception:
+        return {}
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
+
 def get_migration_files():
     """Получить список файлов миграций в порядке версий"""
     if not MIGRATIONS_DIR.exists():
@@ -64,38 +223,171 @@ def get_migration_files():
     return migration_files
 
 
+def _record_migration(cursor, version: str, file_path: Path):
+    cursor.execute("""
+        INSERT INTO schema_migrations (version, description)
+        VALUES (%s, %s)
+        ON CONFLICT (version) DO UPDATE
+        SET completed = TRUE, applied_at = CURRENT_TIMESTAMP
+    """, (version, f"Migration from {file_path.name}"))
+
+
+def _apply_transactional(conn, version: str, file_path: Path, sql: str, options: dict):
+    """Весь файл в одной транзакции"""
+    def attempt():
+        cursor = conn.cursor()
+        try:
+            _set_timeouts(cursor, options, local=True)
+            cursor.execute(sql)
+            _record_migration(cursor, version, file_path)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    
+    _with_lock_retries(version, attempt)
+
+
+def _apply_no_transaction(conn, version: str, file_path: Path, sql: str, options: dict):
+    """
+    Операторы по одному в autocommit.
+    При таймауте блокировки миграция повторяется целиком с первого оператора:
+    прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс, и повтор
+    одного `CREATE ... IF NOT EXISTS` пропустил бы его. При сбое миграция не
+    записывается как примененная и при следующем запуске выполняется заново,
+    поэтому операторы должны быть идемпотентными.
+    """
+    statements = split_sql_statements(sql)
+    
+    def attempt():
+        for statement in statements:
+            cursor.execute(statement)
+    
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        _set_timeouts(cursor, options, local=False)
+        _with_lock_retries(version, attempt)
+        _record_migration(cursor, version, file_path)
+    finally:
+        cursor.execute("RESET lock_timeout")
+        cursor.execute("RESET statement_timeout")
+        cursor.close()
+        conn.autocommit = False
+
+
+def _apply_backfill(conn, version: str, file_path: Path, sql: str, options: dict):
+    """
+    Порционное выполнение SQL по диапазонам ключа (start, end].
+    Верхняя граница (MAX(key) на момент первого запуска) сохраняется в schema_migrations
+    вместе с контрольной точкой и не меняется при продолжении; строки, добавленные
+    позже, должны записываться приложением уже в новом формате.
+    """
+    table = options["backfill-table"]
+    key = options["backfill-key"]
+    batch_size = options["backfill-batch-size"]
+    sql = sql.strip().rstrip(";")
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT MIN({key}), MAX({key}) FROM {table}")
+        min_key, max_key = cursor.fetchone()
+        
+        # Запись о начатой миграции с начальной контрольной точкой и верхней границей.
+        # Если запись уже есть (продолжение), используются сохраненные значения
+        cursor.execute("""
+            INSERT INTO schema_migrations (version, description, completed, checkpoint, max_key)
+            VALUES (%s, %s, FALSE, %s, %s)
+            ON CONFLICT (version) DO NOTHING
+        """, (version, f"Migration from {file_path.name}", (min_key - 1) if min_key is not None else None, max_key))
+        # Записи, начатые до появления столбца max_key, получают границу сейчас
+        cursor.execute(
+            "UPDATE schema_migrations SET max_key = %s WHERE version = %s AND max_key IS NULL AND checkpoint IS NOT NULL",
+            (max_key, version)
+        )
+        cursor.execute("SELECT checkpoint, max_key FROM schema_migrations WHERE version = %s", (version,))
+        checkpoint, max_key = cursor.fetchone()
+        conn.commit()
+        
+        if checkpoint is not None and max_key is not None:
+            # Таблица могла опустеть после первого запуска (min_key is None)
+            if min_key is None or checkpoint >= min_key:
+                logger.info(f"Продолжение backfill {version} с ключа {checkpoint}")
+            total = max(max_key - checkpoint, 0)
+            started_at = time.monotonic()
+            
+            while checkpoint < max_key:
+                start, end = checkpoint, min(checkpoint + batch_size, max_key)
+                
+                def run_batch():
+                    try:
+                        _set_timeouts(cursor, options, local=True)
+                        cursor.execute(sql, {"start": start, "end": end})
+                        cursor.execute(
+                            "UPDATE schema_migrations SET checkpoint = %s WHERE version = %s",
+                            (end, version)
+                        )
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                
+                _with_lock_retries(f"{version}, ключи {start}..{end}", run_batch)
+                checkpoint = end
+                
+                done = total - (max_key - checkpoint)
+                logger.info(
+                    f"Backfill {version}: {done}/{total} ключей "
+                    f"({done * 100 // max(total, 1)}%, {time.monotonic() - started_at:.1f} с)"
+                )
+        
+        _record_migration(cursor, version, file_path)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
 def apply_migration(version: str, file_path: Path):
     """Применить одну миграцию"""
     conn = get_db_connection()
-    cursor = conn.cursor()
     try:
         # Читаем SQL из файла
         sql = file_path.read_text(encoding='utf-8')
+        options = parse_migration_options(file_path, sql)
         
-        # Выполняем SQL
-        cursor.execute(sql)
-        
-        # Записываем информацию о примененной миграции
-        cursor.execute("""
-            INSERT INTO schema_migrations (version, description)
-            VALUES (%s, %s)
-            ON CONFLICT (version) DO NOTHING
-        """, (version, f"Migration from {file_path.name}"))
+        if options["migration"] == MODE_NO_TRANSACTION:
+            _apply_no_transaction(conn, version, file_path, sql, options)
+        elif options["migration"] == MODE_BACKFILL:
+            _apply_backfill(conn, version, file_path, sql, options)
+        else:
+            _apply_transactional(conn, version, file_path, sql, options)
         
-        conn.commit()
         logger.info(f"✓ Применена миграция: {version}")
         return True
     except Exception as e:
-        conn.rollback()
         logger.error(f"✗ Ошибка при применении миграции {version}: {e}")
         raise
     finally:
-        cursor.close()
         return_db_connection(conn)
 
 
-def run_migrations():
-    """Применить все непримененные миграции"""
+def is_backfill_migration(file_path: Path) -> bool:
+    """Является ли файл backfill-миграцией"""
+    sql = file_path.read_text(encoding='utf-8')
+    return parse_migration_options(file_path, sql)["migration"] == MODE_BACKFILL
+
+
+def run_migrations(run_backfills: bool = True):
+    """
+    Применить все непримененные миграции.
+    При run_backfills=False применение останавливается перед первой backfill-миграцией,
+    чтобы не нарушать порядок версий; ее нужно выполнить через migrate.py.
+    """
     logger.info("Запуск системы миграций...")
     
     # Инициализируем таблицу миграций
@@ -119,6 +411,12 @@ def run_migrations():
     applied_count = 0
     for version, file_path in migration_files:
         if version not in applied_migrations:
+            if not run_backfills and is_backfill_migration(file_path):
+                logger.warning(
+                    f"Миграция {version} — backfill, она и последующие миграции не применены. "
+                    f"Выполните: python migrate.py"
+                )
+                break
             logger.info(f"Применение миграции {version}...")
             apply_migration(version, file_path)
             applied_count += 1
@@ -141,7 +439,7 @@ def get_migration_status():
     return {
         "applied": sorted(applied),
         "pending": sorted(pending),
+        "in_progress": get_backfills_in_progress(),
         "total": len(all_migrations),
         "applied_count": len(applied)
     }
-
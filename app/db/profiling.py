@@ -0,0 +1,142 @@
+"""
+Профилирование SQL-запросов.
+
+Курсор ProfilingCursor (подключается как cursor_factory пула соединений) замеряет
+время каждого запроса и число строк, запоминает эндпоинт, из которого запрос выполнен,
+и логирует запросы дольше SLOW_QUERY_THRESHOLD_MS. Для части медленных читающих
+запросов (SLOW_QUERY_EXPLAIN_SAMPLE_RATE) дополнительно снимается план
+EXPLAIN (ANALYZE, BUFFERS). Последние медленные запросы хранятся в кольцевом буфере
+и доступны через /debug/slow-queries. Параметры задаются в ProfilingConfig (app/config.py).
+"""
+import re
+import time
+import random
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+import psycopg2.extensions
+from app.config import profiling_config
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста запроса в логе и буфере
+_MAX_QUERY_LENGTH = 2000
+
+# Эндпоинт текущего запроса (устанавливается middleware в app/main.py)
+current_endpoint: ContextVar[Optional[str]] = ContextVar("current_endpoint", default=None)
+
+_slow_queries = deque(maxlen=profiling_config.SLOW_QUERY_BUFFER_SIZE)
+_slow_queries_lock = threading.Lock()
+
+# EXPLAIN ANALYZE выполняет запрос, поэтому допускаются только читающие запросы.
+# Кроме изменяющих операторов исключаются функции, эффект которых не отменяется
+# откатом к точке сохранения (последовательности, advisory-блокировки, уведомления)
+_READ_ONLY_RE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_MODIFYING_RE = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|FOR\s+(NO\s+KEY\s+)?UPDATE|FOR\s+(KEY\s+)?SHARE"
+    r"|nextval|setval|pg_advisory_\w+|pg_notify|dblink\w*)\b",
+    re.IGNORECASE
+)
+
+
+def _normalize_query(query) -> str:
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", errors="replace")
+    query = " ".join(str(query).split())
+    return query[:_MAX_QUERY_LENGTH]
+
+
+def _is_read_only(query: str) -> bool:
+    return bool(_READ_ONLY_RE.match(query)) and not _MODIFYING_RE.search(query)
+
+
+def get_slow_queries() -> list[dict]:
+    """Последние медленные запросы, начиная с самого свежего"""
+    with _slow_queries_lock:
+        return list(reversed(_slow_queries))
+
+
+class ProfilingCursor(psycopg2.extensions.cursor):
+    """Курсор с замером времени запросов"""
+
+    def execute(self, query, vars=None):
+        if not profiling_config.QUERY_PROFILING_ENABLED or self.name is not None:
+            return super().execute(query, vars)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._record(query, vars, started)
+
+    def executemany(self, query, vars_list):
+        if not profiling_config.QUERY_PROFILING_ENABLED:
+            return super().executemany(query, vars_list)
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._record(query, None, started, batch=True)
+
+    def _record(self, query, vars, started: float, batch: bool = False):
+        duration_ms = (time.perf_counter() - started) * 1000
+        # Быстрые запросы без DEBUG-логирования не требуют ничего, кроме замера времени
+        if duration_ms < profiling_config.SLOW_QUERY_THRESHOLD_MS:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    f"SQL {duration_ms:.1f} мс, строк {self.rowcount}, "
+                    f"эндпоинт {current_endpoint.get()}: {_normalize_query(query)[:200]}"
+                )
+            return
+
+        endpoint = current_endpoint.get()
+        text = _normalize_query(query)
+        plan = None
+        if not batch and _is_read_only(text) and random.random() < profiling_config.SLOW_QUERY_EXPLAIN_SAMPLE_RATE:
+            plan = self._explain(query, vars)
+
+        logger.warning(
+            f"Медленный запрос: {duration_ms:.1f} мс, строк {self.rowcount}, эндпоинт {endpoint}: {text}"
+            + (f"\n{plan}" if plan else "")
+        )
+        with _slow_queries_lock:
+            _slow_queries.append({
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "endpoint": endpoint,
+                "duration_ms": round(duration_ms, 1),
+                "rows": self.rowcount,
+                "batch": batch,
+                "query": text,
+                "plan": plan
+            })
+
+    def _explain(self, query, vars) -> Optional[str]:
+        """
+        План EXPLAIN (ANALYZE, BUFFERS) запроса.
+        ANALYZE выполняет запрос повторно, поэтому план снимается только в открытой
+        транзакции (не в autocommit) отдельным курсором внутри точки сохранения,
+        которая затем откатывается: изменения, сделанные функциями в SELECT, отменяются,
+        а ошибка не прерывает транзакцию приложения. Эффекты, которые откат не отменяет
+        (nextval, advisory-блокировки и т. п.), исключаются по тексту запроса
+        (см. _MODIFYING_RE); пользовательские функции с такими эффектами не распознаются.
+        """
+        conn = self.connection
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_INTRANS:
+            # autocommit, простой соединения или прерванная ошибкой транзакция
+            return None
+        cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        try:
+            cursor.execute("SAVEPOINT profiling_explain")
+            try:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query}", vars)
+                return "\n".join(row[0] for row in cursor.fetchall())
+            finally:
+                cursor.execute("ROLLBACK TO SAVEPOINT profiling_explain")
+                cursor.execute("RELEASE SAVEPOINT profiling_explain")
+        except Exception as e:
+            logger.warning(f"Не удалось получить план запроса: {e}")
+            return None
+        finally:
+            cursor.close()
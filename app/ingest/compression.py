@@ -0,0 +1,170 @@
+"""
+Поддержка сжатых загрузок (.csv.gz, .csv.zst).
+
+Сжатие определяется по сигнатуре файла, расширение и заголовок Content-Encoding
+части multipart только проверяются на соответствие ей. Распаковка потоковая:
+распакованные данные сразу передаются парсеру CSV, а их объем ограничивается
+MAX_DECOMPRESSED_SIZE для защиты от zip-бомб.
+"""
+import gzip
+import zlib
+import logging
+from typing import BinaryIO, Optional
+
+try:
+    import zstandard
+except ImportError:  # zstandard опционален, без него .csv.zst не принимаются
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+GZIP = "gzip"
+ZSTD = "zstd"
+
+_MAGIC = {
+    GZIP: b"\x1f\x8b",
+    ZSTD: b"\x28\xb5\x2f\xfd",
+}
+
+_SUFFIXES = {
+    GZIP: (".gz",),
+    ZSTD: (".zst", ".zstd"),
+}
+
+# Порции сжатых данных zstd, передаваемые распаковщику за один вызов. Одна порция
+# распаковывается целиком: RLE-блок из 4 байт дает до 128 КБ, поэтому вывод
+# одной порции из 128 байт не превышает 4 МБ
+_ZSTD_FEED_SIZE = 128
+_ZSTD_READ_SIZE = 64 * 1024
+
+# Ошибки, которые распаковщики выбрасывают на поврежденных данных
+_CORRUPTION_ERRORS = (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+class CompressedInputError(ValueError):
+    """Сжатый файл поврежден, не поддерживается или превышает лимиты"""
+
+
+class DecompressedSizeExceeded(CompressedInputError):
+    """Объем распакованных данных превысил допустимый"""
+
+
+def _size_exceeded(limit: int) -> DecompressedSizeExceeded:
+    return DecompressedSizeExceeded(
+        f"Размер распакованного файла превышает максимально допустимый ({limit // 1024 // 1024} МБ)"
+    )
+
+
+def detect_compression(filename: str, content_encoding: Optional[str], head: bytes) -> Optional[str]:
+    """
+    Определение сжатия по первым байтам файла.
+    Если по имени файла или Content-Encoding заявлено сжатие, а сигнатура
+    ему не соответствует, выбрасывается CompressedInputError.
+    """
+    detected = next((name for name, magic in _MAGIC.items() if head.startswith(magic)), None)
+
+    declared = None
+    if content_encoding:
+        declared = {"gzip": GZIP, "x-gzip": GZIP, "zstd": ZSTD}.get(content_encoding.strip().lower())
+    for name, suffixes in _SUFFIXES.items():
+        if filename.lower().endswith(suffixes):
+            declared = name
+
+    if declared is not None and declared != detected:
+        raise CompressedInputError(f"Содержимое файла не соответствует заявленному сжатию {declared}")
+
+    if detected == ZSTD and zstandard is None:
+        raise CompressedInputError("Сжатие zstd не поддерживается на сервере")
+
+    return detected
+
+
+class _ZstdReader:
+    """
+    Потоковая распаковка zstd (в том числе нескольких кадров подряд).
+    В отличие от ZstdDecompressor.stream_reader, обрезанный последний кадр
+    не принимается молча за конец данных: если поток закончился внутри кадра,
+    выбрасывается CompressedInputError.
+
+    decompressobj распаковывает переданные данные целиком, поэтому они подаются
+    порциями по _ZSTD_FEED_SIZE байт с проверкой лимита после каждой, а подача
+    прекращается, как только буфер может вернуть запрошенный объем.
+    """
+
+    def __init__(self, raw: BinaryIO, limit: int):
+        self._raw = raw
+        self._limit = limit
+        self._dctx = zstandard.ZstdDecompressor()
+        self._dobj = self._dctx.decompressobj()
+        self._input = b""
+        self._input_pos = 0
+        self._buffer = bytearray()
+        self._total = 0
+        self._eof = False
+
+    def _feed(self, part: bytes):
+        while part:
+            if self._dobj.eof:
+                # Предыдущий кадр закончился, данные относятся к следующему
+                self._dobj = self._dctx.decompressobj()
+            output = self._dobj.decompress(part)
+            self._total += len(output)
+            if self._total > self._limit:
+                raise _size_exceeded(self._limit)
+            self._buffer += output
+            part = self._dobj.unused_data if self._dobj.eof else b""
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            if self._input_pos >= len(self._input):
+                self._input = self._raw.read(_ZSTD_READ_SIZE)
+                self._input_pos = 0
+                if not self._input:
+                    if not self._dobj.eof:
+                        raise CompressedInputError("Сжатый файл zstd обрезан: последний кадр не завершен")
+                    self._eof = True
+                    break
+            part = self._input[self._input_pos:self._input_pos + _ZSTD_FEED_SIZE]
+            self._input_pos += len(part)
+            self._feed(part)
+
+        if size < 0 or size > len(self._buffer):
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class DecompressingReader:
+    """
+    Поток распакованных данных с ограничением объема.
+    Ошибки распаковщика преобразуются в CompressedInputError.
+    """
+
+    def __init__(self, stream, limit: int):
+        self._stream = stream
+        self._limit = limit
+        self.total = 0
+
+    def read(self, size: int = -1) -> bytes:
+        try:
+            data = self._stream.read(size)
+        except _CORRUPTION_ERRORS as e:
+            raise CompressedInputError(f"Поврежденный сжатый файл: {e}") from e
+
+        self.total += len(data)
+        if self.total > self._limit:
+            raise _size_exceeded(self._limit)
+        return data
+
+
+def open_stream(raw: BinaryIO, compression: Optional[str], limit: int) -> BinaryIO:
+    """Поток данных файла с начала: исходный для несжатых, распаковывающий для сжатых"""
+    raw.seek(0)
+    if compression is None:
+        return raw
+    if compression == GZIP:
+        return DecompressingReader(gzip.GzipFile(fileobj=raw, mode="rb"), limit)
+    if compression == ZSTD:
+        return DecompressingReader(_ZstdReader(raw, limit), limit)
+    raise CompressedInputError(f"Неподдерживаемое сжатие: {compression}")
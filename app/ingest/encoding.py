@@ -0,0 +1,165 @@
+"""
+Определение кодировки и разделителя CSV без полного пробного декодирования.
+
+Кодировка выбирается по ограниченной выборке: начало файла и несколько блоков,
+равномерно распределенных по файлу (включая хвост). После этого файл
+декодируется ровно один раз потоково. Выборка не гарантирует результат, поэтому
+при ошибке декодирования в середине потока загрузка повторяется со следующей
+кодировкой из списка (см. upload_grades).
+"""
+import io
+import csv
+import codecs
+import logging
+import itertools
+from typing import BinaryIO, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Размер начала файла, по которому определяются кодировка и разделитель
+PREFIX_SAMPLE_SIZE = 64 * 1024
+
+# Число и размер дополнительных блоков выборки по всему файлу
+SAMPLE_BLOCKS = 8
+SAMPLE_BLOCK_SIZE = 16 * 1024
+
+# Размер порции при потоковом декодировании
+DECODE_CHUNK_SIZE = 64 * 1024
+
+# Размер текста (в символах), по которому csv.Sniffer определяет разделитель
+DELIMITER_SAMPLE_CHARS = 1024
+
+# Максимальная длина строки файла в символах: строка с ФИО и оценкой на порядки короче,
+# а файл без переводов строк не должен целиком накапливаться в памяти
+MAX_LINE_LENGTH = 1024 * 1024
+
+
+class LineTooLongError(ValueError):
+    """Строка файла длиннее MAX_LINE_LENGTH"""
+
+
+def file_size(raw: BinaryIO) -> int:
+    """Размер файла без чтения содержимого (позиция сбрасывается в начало)"""
+    raw.seek(0, io.SEEK_END)
+    size = raw.tell()
+    raw.seek(0)
+    return size
+
+
+def read_samples(raw: BinaryIO, size: int) -> tuple[bytes, list[bytes]]:
+    """Чтение начала файла и блоков выборки (позиция сбрасывается в начало)"""
+    raw.seek(0)
+    prefix = raw.read(PREFIX_SAMPLE_SIZE)
+    blocks = []
+
+    if size > PREFIX_SAMPLE_SIZE:
+        # Блоки равномерно распределены между концом начала файла и концом файла,
+        # последний блок всегда захватывает хвост
+        span = size - PREFIX_SAMPLE_SIZE - SAMPLE_BLOCK_SIZE
+        for i in range(1, SAMPLE_BLOCKS + 1):
+            offset = PREFIX_SAMPLE_SIZE + max(span, 0) * i // SAMPLE_BLOCKS
+            raw.seek(offset)
+            blocks.append(raw.read(SAMPLE_BLOCK_SIZE))
+
+    raw.seek(0)
+    return prefix, blocks
+
+
+def _is_utf8(encoding: str) -> bool:
+    return codecs.lookup(encoding).name == "utf-8"
+
+
+def _decodes(data: bytes, encoding: str, mid_stream: bool) -> bool:
+    """Проверка, что фрагмент декодируется (обрезанный символ на конце допустим)"""
+    if mid_stream and _is_utf8(encoding):
+        # Блок из середины файла может начинаться внутри многобайтового символа UTF-8
+        start = 0
+        while start < min(3, len(data)) and 0x80 <= data[start] <= 0xBF:
+            start += 1
+        data = data[start:]
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(data, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detect_encoding(prefix: bytes, blocks: list[bytes], candidates: list[str]) -> tuple[Optional[str], list[str]]:
+    """
+    Выбор кодировки по выборке.
+    Возвращает (кодировка, запасные кодировки для повторной попытки) или (None, []),
+    если выборку не удалось декодировать ни одной из кодировок.
+    """
+    if prefix.startswith(codecs.BOM_UTF8) and any(_is_utf8(c) for c in candidates):
+        # utf-8-sig пропускает BOM, чтобы он не попал в название первого поля
+        return "utf-8-sig", [c for c in candidates if not _is_utf8(c)]
+
+    for index, encoding in enumerate(candidates):
+        if _decodes(prefix, encoding, mid_stream=False) and all(
+            _decodes(block, encoding, mid_stream=True) for block in blocks
+        ):
+            return encoding, candidates[index + 1:]
+
+    return None, []
+
+
+def detect_delimiter(prefix: bytes, encoding: str) -> str:
+    """Определение разделителя по началу файла (',' если определить не удалось)"""
+    sample = codecs.getincrementaldecoder(encoding)(errors="ignore").decode(prefix, final=False)
+    sample = sample[:DELIMITER_SAMPLE_CHARS]
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=',;\t').delimiter
+        logger.info(f"Определен разделитель CSV: '{delimiter}'")
+        return delimiter
+    except csv.Error:
+        logger.warning("Не удалось автоматически определить разделитель, используется запятая")
+        return ','
+
+
+def _iter_decoded_blocks(raw: BinaryIO, encoding: str, chunk_size: int, max_line_length: int) -> Iterator[str]:
+    """
+    Декодированные порции файла, каждая (кроме последней) заканчивается на '\n'.
+    Незавершенная строка хранится списком частей и склеивается один раз,
+    когда в потоке встречается перевод строки.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = []
+    pending_length = 0
+    while True:
+        chunk = raw.read(chunk_size)
+        text = decoder.decode(chunk, final=not chunk)
+        if not chunk:
+            break
+        cut = text.rfind("\n") + 1
+        if cut:
+            pending.append(text[:cut])
+            yield "".join(pending)
+            pending = [text[cut:]]
+            pending_length = len(text) - cut
+        else:
+            pending.append(text)
+            pending_length += len(text)
+        if pending_length > max_line_length:
+            raise LineTooLongError(f"Строка файла длиннее {max_line_length} символов")
+    pending.append(text)
+    tail = "".join(pending)
+    if tail:
+        yield tail
+
+
+def iter_decoded_lines(
+    raw: BinaryIO,
+    encoding: str,
+    chunk_size: int = DECODE_CHUNK_SIZE,
+    max_line_length: int = MAX_LINE_LENGTH
+) -> Iterator[str]:
+    """
+    Потоковое декодирование файла в строки для csv.reader.
+    Строки разделяются только по '\n' (как у io.StringIO), окончания сохраняются;
+    разбиение порций на строки выполняет io.StringIO без Python-цикла по строкам.
+    UnicodeDecodeError и LineTooLongError пробрасываются вызывающему коду.
+    """
+    return itertools.chain.from_iterable(
+        io.StringIO(block, newline="\n")
+        for block in _iter_decoded_blocks(raw, encoding, chunk_size, max_line_length)
+    )
@@ -0,0 +1,55 @@
+"""
+Сбор ошибок валидации строк CSV с ограниченным объемом.
+
+Подробно (с текстом) сохраняются только первые ошибки, для остальных ведутся
+счетчики по типам и несколько номеров строк-примеров. Это позволяет дешево
+обрабатывать сильно поврежденные файлы и отклонять их на раннем этапе.
+"""
+from collections import Counter
+
+
+class ErrorCollector:
+    """Ограниченный сборщик ошибок строк CSV"""
+
+    def __init__(self, max_details: int, sample_rows: int):
+        self._max_details = max_details
+        self._sample_rows = sample_rows
+        self.total = 0
+        self.details: list[str] = []
+        self.counts = Counter()
+        self.samples: dict[str, list[int]] = {}
+
+    def __len__(self) -> int:
+        return self.total
+
+    def add(self, row_num: int, error_type: str, message: str):
+        """Регистрация ошибки; текст сообщения форматируется только для первых max_details ошибок"""
+        self.total += 1
+        self.counts[error_type] += 1
+
+        samples = self.samples.setdefault(error_type, [])
+        if len(samples) < self._sample_rows:
+            samples.append(row_num)
+
+        if len(self.details) < self._max_details:
+            self.details.append(f"Строка {row_num}: {message}")
+
+    def invalid_ratio_exceeded(self, rows_checked: int, max_invalid_percent: float) -> bool:
+        """Доля ошибочных строк среди проверенных превышает допустимую"""
+        return rows_checked > 0 and self.total * 100 > max_invalid_percent * rows_checked
+
+    def summary(self) -> dict:
+        """Количество ошибок и номера строк-примеров по типам"""
+        return {
+            error_type: {"count": count, "sample_rows": self.samples[error_type]}
+            for error_type, count in self.counts.most_common()
+        }
+
+    def describe(self, limit: int) -> str:
+        """Первые limit ошибок одной строкой для сообщения об ошибке загрузки"""
+        shown = self.details[:limit]
+        text = '; '.join(shown)
+        # Подробно может храниться меньше limit ошибок (max_details), остальные считаются оставшимися
+        if self.total > len(shown):
+            text += f" (и еще {self.total - len(shown)} ошибок)"
+        return text
@@ -1,8 +1,14 @@
+import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from app.api import router
-from app.db.connection import init_db_pool, close_db_pool
-from app.db.migrations import run_migrations
+from app.api.request_decompression import RequestDecompressionMiddleware
+from app.db.connection import init_db_pool, close_db_pool, get_db_connection, return_db_connection
+from app.db.migrations import run_migrations, MIGRATIONS_RUN_BACKFILLS_ON_STARTUP
+from app.config import analytics_config, compaction_config
+from app.analytics.engine import analytics_engine, load_engine_from_db
+from app.db.profiling import current_endpoint
+from app.db.compaction import run_compaction_periodically
 import logging
 
 # Настройка логирования
@@ -20,13 +26,30 @@ async def lifespan(app: FastAPI):
     logger.info("Запуск приложения Student Grades API")
     init_db_pool()
     # Применяем миграции при старте приложения
-    run_migrations()
+    run_migrations(run_backfills=MIGRATIONS_RUN_BACKFILLS_ON_STARTUP)
+    if analytics_config.ANALYTICS_ENGINE_ENABLED:
+        conn = get_db_connection()
+        try:
+            load_engine_from_db(analytics_engine, conn)
+        finally:
+            return_db_connection(conn)
+    compaction_task = None
+    interval_hours = compaction_config.COMPACTION_INTERVAL_HOURS
+    if interval_hours > 0:
+        compaction_task = asyncio.create_task(run_compaction_periodically(interval_hours))
+        logger.info(f"Фоновая компактизация grades каждые {interval_hours} ч")
     logger.info("Приложение успешно запущено")
     
     yield
     
     # Shutdown
     logger.info("Остановка приложения")
+    if compaction_task is not None:
+        compaction_task.cancel()
+        try:
+            await compaction_task
+        except asyncio.CancelledError:
+            pass
     close_db_pool()
     logger.info("Приложение остановлено")
 
@@ -39,6 +62,17 @@ app = FastAPI(
 )
 
 app.include_router(router)
+app.add_middleware(RequestDecompressionMiddleware)
+
+
+@app.middleware("http")
+async def track_endpoint(request: Request, call_next):
+    """Запоминает эндпоинт запроса для профилирования SQL"""
+    token = current_endpoint.set(f"{request.method} {request.url.path}")
+    try:
+        return await call_next(request)
+    finally:
+        current_endpoint.reset(token)
 
 
 @app.get("/")
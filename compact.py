@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Скрипт компактизации таблицы grades.
+Сворачивает строки старше срока хранения в grade_rollups и удаляет их порциями.
+"""
+import argparse
+from app.db.connection import init_db_pool, close_db_pool, get_db_connection, return_db_connection
+from app.config import compaction_config
+from app.db.compaction import compact_grades, vacuum_grades
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Компактизация таблицы grades")
+    retention_days = compaction_config.GRADES_RETENTION_DAYS
+    batch_size = compaction_config.COMPACTION_BATCH_SIZE
+    parser.add_argument("--cutoff-days", type=int, default=retention_days,
+                        help=f"сворачивать строки старше этого числа дней (по умолчанию {retention_days})")
+    parser.add_argument("--batch-size", type=int, default=batch_size,
+                        help=f"строк в одной транзакции (по умолчанию {batch_size})")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="выполнить VACUUM ANALYZE grades после компактизации")
+    args = parser.parse_args()
+    
+    print("=" * 50)
+    print("Компактизация таблицы grades")
+    print("=" * 50)
+    
+    init_db_pool()
+    conn = get_db_connection()
+    
+    try:
+        moved = compact_grades(conn, retention_days=args.cutoff_days, batch_size=args.batch_size)
+        print(f"\nСтрок перенесено в свертки: {moved}")
+        
+        if args.vacuum and moved:
+            vacuum_grades(conn)
+            print("VACUUM ANALYZE grades выполнен")
+        
+        print("\n" + "=" * 50)
+        print("Компактизация завершена!")
+        print("=" * 50)
+        
+    except Exception as e:
+        print(f"\nОшибка: {e}")
+        exit(1)
+    finally:
+        return_db_connection(conn)
+        close_db_pool()
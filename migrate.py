@@ -25,6 +25,9 @@ if __name__ == "__main__":
         if status['pending']:
             print(f"\nОжидающие миграции: {', '.join(status['pending'])}")
         
+        for version, checkpoint in status['in_progress'].items():
+            print(f"  Backfill {version} прерван, продолжится с ключа {checkpoint}")
+        
         print("\n" + "-" * 50)
         
         # Применяем миграции
@@ -6,4 +6,9 @@ CREATE TABLE IF NOT EXISTS schema_migrations (
     description TEXT
 );
 
+-- Прогресс backfill-миграций: незавершенная миграция хранит последний обработанный ключ
+ALTER TABLE schema_migrations ADD COLUMN IF NOT EXISTS completed BOOLEAN NOT NULL DEFAULT TRUE;
+ALTER TABLE schema_migrations ADD COLUMN IF NOT EXISTS checkpoint BIGINT;
+-- Верхняя граница ключа backfill, зафиксированная при первом запуске
+ALTER TABLE schema_migrations ADD COLUMN IF NOT EXISTS max_key BIGINT;
 
@@ -0,0 +1,14 @@
+
+-- Миграция 002: Таблица скетчей для приближенной аналитики
+
+-- Сериализованные скетчи (Count-Min Sketch, HyperLogLog), объединяемые при каждой загрузке
+CREATE TABLE IF NOT EXISTS grade_sketches (
+    name VARCHAR(64) PRIMARY KEY,
+    data BYTEA,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Строки создаются заранее, чтобы параллельные загрузки блокировали их через FOR UPDATE
+INSERT INTO grade_sketches (name, data)
+VALUES ('grade_counts_cms', NULL), ('students_hll', NULL)
+ON CONFLICT (name) DO NOTHING;
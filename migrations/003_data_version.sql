@@ -0,0 +1,12 @@
+
+-- Миграция 003: Версия данных для ETag / Last-Modified аналитических эндпоинтов
+
+-- Единственная строка, версия увеличивается в транзакции каждой успешной загрузки
+CREATE TABLE IF NOT EXISTS data_version (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO data_version (id) VALUES (1)
+ON CONFLICT (id) DO NOTHING;
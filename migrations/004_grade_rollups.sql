@@ -0,0 +1,25 @@
+
+-- Миграция 004: Свертки старых оценок и представление с полными счетчиками
+
+-- Число оценок grade у студента по строкам, перенесенным из grades компактизацией
+CREATE TABLE IF NOT EXISTS grade_rollups (
+    full_name VARCHAR(255) NOT NULL,
+    grade INTEGER NOT NULL CHECK (grade IN (2, 3, 4, 5)),
+    count BIGINT NOT NULL CHECK (count > 0),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (full_name, grade)
+);
+
+-- Точные счетчики оценок: свертки плюс еще не свернутые строки grades.
+-- Условия по full_name и grade проталкиваются в обе части UNION ALL.
+CREATE OR REPLACE VIEW grade_counts AS
+SELECT full_name, grade, SUM(count)::BIGINT AS count
+FROM (
+    SELECT full_name, grade, count
+    FROM grade_rollups
+    UNION ALL
+    SELECT full_name, grade, COUNT(*)
+    FROM grades
+    GROUP BY full_name, grade
+) counts
+GROUP BY full_name, grade;
@@ -0,0 +1,7 @@
+
+-- Миграция 005: Индекс по времени создания оценок для выборки строк компактизацией
+-- Выполняется без транзакции (суффикс .notx.sql), чтобы не блокировать запись в grades
+
+-- Миграция применяется повторно только после прерывания, когда индекс мог остаться невалидным
+DROP INDEX CONCURRENTLY IF EXISTS idx_grades_created_at;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_grades_created_at ON grades(created_at);
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Скрипт пересборки скетчей приближенной аналитики.
+Строит Count-Min Sketch и HyperLogLog заново по представлению grade_counts,
+например после изменения параметров SKETCH_* или чтобы построить скетчи
+по уже имеющимся данным, не дожидаясь первой загрузки.
+"""
+from app.db.connection import init_db_pool, close_db_pool, get_db_connection, return_db_connection
+from app.analytics.sketches import rebuild_sketches
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("Пересборка скетчей")
+    print("=" * 50)
+
+    init_db_pool()
+    conn = get_db_connection()
+
+    try:
+        cms, hll = rebuild_sketches(conn)
+        print(f"\nЗаписей в Count-Min Sketch: {cms.total}")
+        print(f"Студентов (HyperLogLog): ~{hll.estimate()}")
+
+        print("\n" + "=" * 50)
+        print("Скетчи пересобраны!")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\nОшибка: {e}")
+        exit(1)
+    finally:
+        return_db_connection(conn)
+        close_db_pool()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Сравнение прежнего способа декодирования CSV (полные пробные декодирования
+по всем кодировкам) с определением кодировки по выборке и потоковым декодированием.
+Использование:
+    python -m scripts.benchmark_encoding [--rows N] [--repeat N]
+"""
+import io
+import csv
+import time
+import argparse
+import tracemalloc
+from app.config import validation_config
+from app.ingest.encoding import file_size, read_samples, detect_encoding, detect_delimiter, iter_decoded_lines
+
+
+def make_file(rows: int, cyrillic_tail_only: bool) -> bytes:
+    """CSV в windows-1251: кириллица либо во всех строках, либо только в последней"""
+    lines = ["full_name;grade"]
+    for i in range(rows - 1):
+        name = f"Student {i}" if cyrillic_tail_only else f"Студент Номер {i}"
+        lines.append(f"{name};{2 + i % 4}")
+    lines.append("Иванов Иван Иванович;2")
+    return ("\n".join(lines) + "\n").encode("windows-1251")
+
+
+def parse_full_decode(contents: bytes) -> int:
+    """Прежний способ: полное декодирование каждой кодировкой до успеха"""
+    csv_content = None
+    for encoding in validation_config.SUPPORTED_ENCODINGS:
+        try:
+            csv_content = contents.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    try:
+        delimiter = csv.Sniffer().sniff(csv_content[:1024], delimiters=',;\t').delimiter
+    except csv.Error:
+        delimiter = ','
+    return sum(1 for _ in csv.DictReader(io.StringIO(csv_content), delimiter=delimiter))
+
+
+def parse_sampled(contents: bytes) -> int:
+    """Новый способ: кодировка по выборке, одно потоковое декодирование"""
+    raw = io.BytesIO(contents)
+    prefix, blocks = read_samples(raw, file_size(raw))
+    encoding, _ = detect_encoding(prefix, blocks, validation_config.SUPPORTED_ENCODINGS)
+    delimiter = detect_delimiter(prefix, encoding)
+    return sum(1 for _ in csv.DictReader(iter_decoded_lines(raw, encoding), delimiter=delimiter))
+
+
+def measure(func, contents: bytes, repeat: int) -> tuple[float, float]:
+    """Лучшее время (мс) и пиковая дополнительная память (МБ)"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(contents)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(contents)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк определения кодировки CSV")
+    parser.add_argument("--rows", type=int, default=500000, help="число строк в файле")
+    parser.add_argument("--repeat", type=int, default=3, help="число повторов замера времени")
+    args = parser.parse_args()
+
+    for title, tail_only in (("кириллица только в конце файла", True), ("кириллица во всех строках", False)):
+        contents = make_file(args.rows, tail_only)
+        print("=" * 60)
+        print(f"windows-1251, {title}: {len(contents) / 1024 / 1024:.1f} МБ, {args.rows} строк")
+        for name, func in (("Полное пробное декодирование", parse_full_decode), ("Выборка + потоковое", parse_sampled)):
+            elapsed, peak = measure(func, contents, args.repeat)
+            print(f"  {name:<30} {elapsed:8.1f} мс, пик памяти {peak:6.1f} МБ")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Сравнение точных SQL-запросов с приближенными ответами на скетчах.
+Использование:
+    python -m scripts.benchmark_sketches [--samples N]
+
+Скетчи строятся при первой загрузке; без загрузок их можно построить
+скриптом rebuild_sketches.py.
+
+--samples   число случайных студентов для проверки точности CMS (по умолчанию 200)
+"""
+import sys
+import time
+import argparse
+from app.db.connection import init_db_pool, close_db_pool, get_db_connection, return_db_connection
+from app.analytics.sketches import load_sketches, grade_key
+
+
+def timed(func):
+    """Выполнить функцию и вернуть (результат, время в мс)"""
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run_benchmark(samples: int):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        (cms, hll), sketch_load_ms = timed(lambda: load_sketches(cursor))
+        conn.rollback()
+        if cms is None or hll is None:
+            print("❌ Скетчи еще не построены, запустите python rebuild_sketches.py")
+            return False
+
+        def exact_distinct():
+            cursor.execute("SELECT COUNT(DISTINCT full_name) FROM grade_counts")
+            return cursor.fetchone()[0]
+
+        exact_students, exact_distinct_ms = timed(exact_distinct)
+        approx_students, approx_distinct_ms = timed(hll.estimate)
+
+        print("=" * 50)
+        print("Уникальные студенты")
+        print(f"  Точно (SQL):        {exact_students} за {exact_distinct_ms:.1f} мс")
+        print(f"  HyperLogLog:        {approx_students} за {sketch_load_ms + approx_distinct_ms:.1f} мс (с загрузкой скетчей)")
+        if exact_students:
+            print(f"  Ошибка:             {abs(approx_students - exact_students) / exact_students:.3%} "
+                  f"(стандартная {hll.relative_error:.3%})")
+
+        cursor.execute("""
+            SELECT full_name FROM (SELECT DISTINCT full_name FROM grade_counts) s
+            ORDER BY random() LIMIT %s
+        """, (samples,))
+        names = [row[0] for row in cursor.fetchall()]
+        if not names:
+            print("Нет данных для проверки точности Count-Min Sketch")
+            return True
+
+        def exact_counts():
+            cursor.execute("""
+                SELECT full_name, count FROM grade_counts
+                WHERE grade = 2 AND full_name = ANY(%s)
+            """, (names,))
+            return dict(cursor.fetchall())
+
+        exact, exact_counts_ms = timed(exact_counts)
+        approx, approx_counts_ms = timed(lambda: {name: cms.estimate(grade_key(name, 2)) for name in names})
+
+        errors = [approx[name] - exact.get(name, 0) for name in names]
+        bound = cms.error_bound()
+        print("=" * 50)
+        print(f"Число двоек у {len(names)} случайных студентов")
+        print(f"  Точно (SQL):        {exact_counts_ms:.1f} мс")
+        print(f"  Count-Min Sketch:   {approx_counts_ms:.1f} мс")
+        print(f"  Завышение:          среднее {sum(errors) / len(errors):.2f}, максимальное {max(errors)}")
+        print(f"  Граница ошибки:     {bound} (epsilon={cms.epsilon:.5f}, вероятность {1 - cms.delta:.2%})")
+        print(f"  Превышений границы: {sum(error > bound for error in errors)}")
+        print("=" * 50)
+        return True
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк приближенной аналитики на скетчах")
+    parser.add_argument("--samples", type=int, default=200, help="число студентов для проверки CMS")
+    args = parser.parse_args()
+
+    init_db_pool()
+    try:
+        success = run_benchmark(args.samples)
+    finally:
+        close_db_pool()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,8 +21,8 @@ def upload_csv_file(file_path: str):
         print(f"❌ Ошибка: Файл '{file_path}' не найден")
         return False
     
-    if not file_path.endswith('.csv'):
-        print(f"❌ Ошибка: Файл должен иметь расширение .csv")
+    if not file_path.endswith(('.csv', '.csv.gz', '.csv.zst')):
+        print(f"❌ Ошибка: Файл должен иметь расширение .csv, .csv.gz или .csv.zst")
         return False
     
     print(f"📤 Загрузка файла: {file_path}")
@@ -48,6 +48,10 @@ def upload_csv_file(file_path: str):
                     print("\nДетали ошибок:")
                     for error in data['error_details']:
                         print(f"   - {error}")
+                if 'error_summary' in data:
+                    print("\nОшибки по типам:")
+                    for error_type, info in data['error_summary'].items():
+                        print(f"   - {error_type}: {info['count']} (строки: {', '.join(map(str, info['sample_rows']))})")
             
             return True
         else:
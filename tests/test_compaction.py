@@ -0,0 +1,153 @@
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+import pytest
+from app.config import CompactionConfig
+from app.db import compaction
+from app.db.compaction import compact_grades
+from app.db.migrations import split_sql_statements
+
+CUTOFF = datetime(2024, 1, 1)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((sql, params))
+        if self.conn.fail_on_batch and sql is compaction._COMPACT_BATCH_SQL:
+            raise RuntimeError("ошибка порции")
+
+    def fetchone(self):
+        return (self.conn.results.pop(0),)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, moved=(), fail_on_batch=False):
+        self.results = [CUTOFF, *moved]
+        self.fail_on_batch = fail_on_batch
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def batches(conn):
+    return [params for sql, params in conn.executed if sql is compaction._COMPACT_BATCH_SQL]
+
+
+def test_batches_until_nothing_moved():
+    conn = FakeConnection(moved=[3, 2, 0])
+    assert compact_grades(conn, retention_days=30, batch_size=3) == 5
+    # Граница вычисляется один раз и используется во всех порциях
+    assert conn.executed[0][1] == (30,)
+    assert batches(conn) == [(CUTOFF, 3)] * 3
+    # Граница и каждая порция фиксируются отдельно
+    assert conn.commits == 4
+
+
+def test_stop_between_batches():
+    stop = threading.Event()
+    conn = FakeConnection(moved=[3, 3, 3])
+    conn.commit = lambda: stop.set()
+    assert compact_grades(conn, batch_size=3, stop=stop) == 0
+    assert batches(conn) == []
+
+
+def test_error_rolls_back_and_raises():
+    conn = FakeConnection(fail_on_batch=True)
+    with pytest.raises(RuntimeError):
+        compact_grades(conn)
+    assert conn.rollbacks == 1
+
+
+@pytest.mark.parametrize("retention_days, batch_size", [(-1, 10), (30, 0)])
+def test_invalid_arguments(retention_days, batch_size):
+    with pytest.raises(ValueError):
+        compact_grades(FakeConnection(), retention_days=retention_days, batch_size=batch_size)
+
+
+def test_batch_moves_rows_in_one_statement():
+    # Удаление из grades и добавление в свертки — один оператор, поэтому
+    # grade_counts не видит состояния, в котором строки уже удалены, но не свернуты
+    assert split_sql_statements(compaction._COMPACT_BATCH_SQL) == [compaction._COMPACT_BATCH_SQL.strip()]
+    sql = " ".join(compaction._COMPACT_BATCH_SQL.split())
+    assert "DELETE FROM grades" in sql
+    assert "INSERT INTO grade_rollups" in sql
+    assert "SET count = grade_rollups.count + EXCLUDED.count" in sql
+    assert "FOR UPDATE SKIP LOCKED" in sql
+
+
+@pytest.mark.parametrize("name, value", [
+    ("GRADES_RETENTION_DAYS", -1),
+    ("COMPACTION_BATCH_SIZE", 0),
+    ("COMPACTION_INTERVAL_HOURS", -1),
+])
+def test_compaction_config_rejects_invalid_values(monkeypatch, name, value):
+    monkeypatch.setattr(CompactionConfig, name, value)
+    with pytest.raises(ValueError, match=name):
+        CompactionConfig.validate()
+
+
+@pytest.fixture
+def db():
+    # Миграция 004 без синтаксиса, которого нет в SQLite (приведение типов, OR REPLACE)
+    sql = Path("migrations/004_grade_rollups.sql").read_text(encoding="utf-8")
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE grades (id INTEGER PRIMARY KEY, full_name TEXT NOT NULL, "
+        "grade INTEGER NOT NULL, created_at TEXT NOT NULL)"
+    )
+    conn.executescript(re.sub(r"::BIGINT", "", sql).replace("CREATE OR REPLACE VIEW", "CREATE VIEW"))
+    yield conn
+    conn.close()
+
+
+def grade_counts(db) -> dict:
+    return {(name, grade): count for name, grade, count in db.execute("SELECT * FROM grade_counts")}
+
+
+def compact_batch(db, cutoff: str, batch_size: int) -> int:
+    """Перенос порции так же, как _COMPACT_BATCH_SQL, одной транзакцией"""
+    with db:
+        rows = db.execute(
+            "SELECT id, full_name, grade FROM grades WHERE created_at < ? LIMIT ?", (cutoff, batch_size)
+        ).fetchall()
+        db.executemany("""
+            INSERT INTO grade_rollups (full_name, grade, count) VALUES (?, ?, 1)
+            ON CONFLICT (full_name, grade) DO UPDATE SET count = grade_rollups.count + excluded.count
+        """, [(name, grade) for _, name, grade in rows])
+        db.executemany("DELETE FROM grades WHERE id = ?", [(row_id,) for row_id, _, _ in rows])
+    return len(rows)
+
+
+def test_grade_counts_view_exact_during_compaction(db):
+    rows = [
+        ("Иванов", 2, "2023-06-01"), ("Иванов", 2, "2023-07-01"), ("Иванов", 2, "2024-02-01"),
+        ("Иванов", 5, "2023-06-01"), ("Петров", 2, "2024-03-01"), ("Петров", 3, "2023-01-01"),
+    ]
+    db.executemany("INSERT INTO grades (full_name, grade, created_at) VALUES (?, ?, ?)", rows)
+    expected = {("Иванов", 2): 3, ("Иванов", 5): 1, ("Петров", 2): 1, ("Петров", 3): 1}
+    assert grade_counts(db) == expected
+
+    while compact_batch(db, "2024-01-01", batch_size=1):
+        assert grade_counts(db) == expected
+
+    assert db.execute("SELECT COUNT(*) FROM grades").fetchone()[0] == 2
+    assert dict(((n, g), c) for n, g, c in db.execute(
+        "SELECT full_name, grade, count FROM grade_rollups"
+    )) == {("Иванов", 2): 2, ("Иванов", 5): 1, ("Петров", 3): 1}
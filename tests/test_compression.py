@@ -0,0 +1,116 @@
+import io
+import gzip
+import struct
+import tracemalloc
+import pytest
+from app.ingest.compression import (
+    GZIP, ZSTD, CompressedInputError, DecompressedSizeExceeded, detect_compression, open_stream
+)
+
+zstandard = pytest.importorskip("zstandard")
+
+DATA = b"".join(b"student %d;2\n" % i for i in range(100_000))
+LIMIT = 100 * 1024 * 1024
+
+
+def read_all(stream) -> bytes:
+    parts = []
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk:
+            return b"".join(parts)
+        parts.append(chunk)
+
+
+def decompress(data: bytes, compression: str, limit: int = LIMIT) -> bytes:
+    return read_all(open_stream(io.BytesIO(data), compression, limit))
+
+
+def test_zstd_roundtrip():
+    assert decompress(zstandard.ZstdCompressor().compress(DATA), ZSTD) == DATA
+
+
+def test_zstd_streamed_frame_without_content_size():
+    compressor = zstandard.ZstdCompressor().compressobj()
+    data = compressor.compress(DATA) + compressor.flush()
+    assert decompress(data, ZSTD) == DATA
+
+
+def test_zstd_multiple_frames():
+    data = zstandard.ZstdCompressor().compress(DATA) + zstandard.ZstdCompressor().compress(b"tail;3\n")
+    assert decompress(data, ZSTD) == DATA + b"tail;3\n"
+
+
+@pytest.mark.parametrize("keep", [0.5, 0.99])
+def test_truncated_zstd_rejected(keep):
+    data = zstandard.ZstdCompressor().compress(DATA)
+    with pytest.raises(CompressedInputError):
+        decompress(data[:int(len(data) * keep)], ZSTD)
+
+
+def test_truncated_second_zstd_frame_rejected():
+    data = zstandard.ZstdCompressor().compress(DATA) + zstandard.ZstdCompressor().compress(DATA)
+    with pytest.raises(CompressedInputError):
+        decompress(data[:-5], ZSTD)
+
+
+def test_truncated_gzip_rejected():
+    data = gzip.compress(DATA)
+    with pytest.raises(CompressedInputError):
+        decompress(data[:len(data) // 2], GZIP)
+
+
+@pytest.mark.parametrize("compression, compress", [
+    (GZIP, gzip.compress),
+    (ZSTD, lambda data: zstandard.ZstdCompressor(level=19).compress(data)),
+])
+def test_decompressed_size_limit(compression, compress):
+    with pytest.raises(DecompressedSizeExceeded):
+        decompress(compress(b"\0" * (50 * 1024 * 1024)), compression, limit=10 * 1024 * 1024)
+
+
+def rle_frame(blocks: int, block_size: int = 128 * 1024) -> bytes:
+    """
+    Кадр zstd из RLE-блоков: 4 байта сжатых данных на block_size байт вывода.
+    Дескриптор кадра 0x00 (без размера содержимого), окно 2^17 = 128 КБ.
+    """
+    header = b"\x28\xb5\x2f\xfd" + b"\x00" + bytes([7 << 3])
+    body = []
+    for i in range(blocks):
+        last = 1 if i == blocks - 1 else 0
+        body.append(struct.pack("<I", (block_size << 3) | (1 << 1) | last)[:3] + b"\x00")
+    return header + b"".join(body)
+
+
+def test_rle_frame_is_valid():
+    assert decompress(rle_frame(4), ZSTD) == b"\0" * (4 * 128 * 1024)
+
+
+def test_rle_bomb_stopped_without_buffering_output():
+    # 8 КБ сжатых данных разворачиваются в 256 МБ
+    data = rle_frame(2048)
+    tracemalloc.start()
+    try:
+        with pytest.raises(DecompressedSizeExceeded):
+            decompress(data, ZSTD, limit=10 * 1024 * 1024)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Лимит плюс вывод одной порции, а не весь распакованный объем
+    assert peak < 40 * 1024 * 1024
+
+
+def test_zstd_read_returns_requested_size():
+    stream = open_stream(io.BytesIO(rle_frame(64)), ZSTD, LIMIT)
+    assert len(stream.read(1000)) == 1000
+
+
+def test_detect_compression_by_magic():
+    assert detect_compression("grades.csv.zst", None, zstandard.ZstdCompressor().compress(b"x")[:4]) == ZSTD
+    assert detect_compression("grades.csv", "gzip", gzip.compress(b"x")[:4]) == GZIP
+    assert detect_compression("grades.csv", None, b"full") is None
+
+
+def test_declared_compression_must_match_magic():
+    with pytest.raises(CompressedInputError):
+        detect_compression("grades.csv.gz", None, b"full")
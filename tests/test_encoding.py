@@ -0,0 +1,99 @@
+import io
+import codecs
+import pytest
+from app.ingest.encoding import (
+    LineTooLongError, detect_encoding, detect_delimiter, iter_decoded_lines
+)
+
+CANDIDATES = ["utf-8", "cp1251"]
+TEXT = "ФИО;Оценка\nИванов Иван;2\nПетров Пётр;5\n"
+
+
+def decode_all(data: bytes, encoding: str, **kwargs) -> list[str]:
+    return list(iter_decoded_lines(io.BytesIO(data), encoding, **kwargs))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64 * 1024])
+def test_multibyte_characters_split_across_chunks(chunk_size):
+    lines = decode_all(TEXT.encode("utf-8"), "utf-8", chunk_size=chunk_size)
+    assert lines == TEXT.splitlines(keepends=True)
+
+
+def test_last_line_without_newline():
+    assert decode_all("a;2\nb;3".encode("utf-8"), "utf-8", chunk_size=2) == ["a;2\n", "b;3"]
+
+
+def test_crlf_kept_for_csv_reader():
+    assert decode_all(b"a;2\r\nb;3\r\n", "utf-8") == ["a;2\r\n", "b;3\r\n"]
+
+
+def test_empty_input():
+    assert decode_all(b"", "utf-8") == []
+
+
+def test_invalid_bytes_raise_unicode_error():
+    with pytest.raises(UnicodeDecodeError):
+        decode_all(b"a;2\n\xff\xfe;3\n", "utf-8", chunk_size=4)
+
+
+def test_truncated_multibyte_character_at_eof_raises():
+    with pytest.raises(UnicodeDecodeError):
+        decode_all("Иван".encode("utf-8")[:-1], "utf-8")
+
+
+def test_newline_free_input_rejected_early():
+    raw = io.BytesIO(b"x" * (10 * 1024 * 1024))
+    with pytest.raises(LineTooLongError):
+        list(iter_decoded_lines(raw, "utf-8", chunk_size=1024, max_line_length=64 * 1024))
+    # Чтение останавливается вскоре после превышения лимита, а не на конце файла
+    assert raw.tell() <= 64 * 1024 + 1024
+
+
+def test_long_line_within_limit_is_joined_once():
+    data = b"x" * 100_000 + b"\ny\n"
+    assert decode_all(data, "utf-8", chunk_size=1000) == ["x" * 100_000 + "\n", "y\n"]
+
+
+def test_bom_selects_utf8_sig_and_is_stripped():
+    data = codecs.BOM_UTF8 + TEXT.encode("utf-8")
+    encoding, fallbacks = detect_encoding(data, [], CANDIDATES)
+    assert encoding == "utf-8-sig"
+    assert fallbacks == ["cp1251"]
+    assert decode_all(data, encoding)[0] == "ФИО;Оценка\n"
+
+
+def test_detect_cp1251():
+    data = TEXT.encode("cp1251")
+    assert detect_encoding(data, [], CANDIDATES) == ("cp1251", [])
+
+
+def test_detect_utf8_with_fallbacks():
+    assert detect_encoding(TEXT.encode("utf-8"), [], CANDIDATES) == ("utf-8", ["cp1251"])
+
+
+def test_prefix_cut_inside_multibyte_character():
+    data = TEXT.encode("utf-8")
+    prefix = data[:data.index("Оценка".encode("utf-8")) + 1]
+    assert detect_encoding(prefix, [], CANDIDATES)[0] == "utf-8"
+
+
+def test_mid_stream_block_starting_inside_character():
+    data = TEXT.encode("utf-8")
+    block = data[data.index("Иванов".encode("utf-8")) + 1:]
+    assert detect_encoding(data[:4], [block], CANDIDATES)[0] == "utf-8"
+
+
+def test_block_with_invalid_utf8_falls_back_to_cp1251():
+    # Начало файла в ASCII, кириллица в cp1251 встречается только дальше по файлу
+    data = b"full_name;grade\nIvanov;2\n"
+    block = "Сидоров;4\n".encode("cp1251")
+    assert detect_encoding(data, [block], CANDIDATES) == ("cp1251", [])
+
+
+def test_undecodable_sample():
+    assert detect_encoding(b"\x98\xff\xfe", [], CANDIDATES) == (None, [])
+
+
+def test_detect_delimiter():
+    assert detect_delimiter(TEXT.encode("utf-8"), "utf-8") == ";"
+    assert detect_delimiter(b"a,b\n1,2\n", "utf-8") == ","
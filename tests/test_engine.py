@@ -0,0 +1,100 @@
+from collections import Counter
+from datetime import datetime, timezone
+import pytest
+from app.analytics import engine as engine_module
+from app.analytics.engine import GradeCountsEngine, load_engine_from_db
+
+VERSION = (1, datetime(2024, 3, 1, tzinfo=timezone.utc))
+
+
+@pytest.fixture(params=["numpy", "array"])
+def engine(request, monkeypatch):
+    if request.param == "array":
+        monkeypatch.setattr(engine_module, "np", None)
+    elif engine_module.np is None:
+        pytest.skip("NumPy не установлен")
+    return GradeCountsEngine([2, 3, 4, 5])
+
+
+def test_filters(engine):
+    engine.load([
+        ("Иванов", 2, 5), ("Петров", 2, 3), ("Сидоров", 2, 4), ("Сидоров", 5, 10), ("Козлов", 5, 1)
+    ], VERSION)
+    assert engine.query(2, gt=3) == [("Иванов", 5), ("Сидоров", 4)]
+    # Студенты без двоек тоже попадают в «меньше 5»
+    assert engine.query(2, lt=5) == [("Сидоров", 4), ("Петров", 3), ("Козлов", 0)]
+    assert engine.query(2, gt=3, lt=5) == [("Сидоров", 4)]
+
+
+def test_tie_order_by_code_points(engine):
+    engine.load([("Яковлева", 2, 4), ("Абрамов", 2, 4), ("Ёжиков", 2, 4), ("Борисов", 2, 7)], VERSION)
+    assert [name for name, _ in engine.query(2, gt=3)] == ["Борисов", "Ёжиков", "Абрамов", "Яковлева"]
+
+
+def test_growth_past_initial_capacity(engine):
+    students = engine_module._INITIAL_CAPACITY * 2 + 10
+    engine.load(((f"Студент {i:05}", 2, i % 7) for i in range(students)), VERSION)
+    assert engine.student_count == students
+
+    engine.apply(Counter({("Студент 00000", 2): 100, ("Новый", 2): 6}), (2, VERSION[1]))
+    result = engine.query(2, gt=5)
+    assert result[0] == ("Студент 00000", 100)
+    assert ("Новый", 6) in result
+    assert len(result) == sum(1 for i in range(1, students) if i % 7 > 5) + 2
+    assert engine.data_version[0] == 2
+
+
+def test_apply_invalidates_cache(engine):
+    engine.load([("Иванов", 2, 3)], VERSION)
+    assert engine.query(2, gt=3) == []
+    engine.apply(Counter({("Иванов", 2): 1}), (2, VERSION[1]))
+    assert engine.query(2, gt=3) == [("Иванов", 4)]
+
+
+def test_unknown_grade_rows_ignored(engine):
+    engine.load([("Иванов", 7, 3)], VERSION)
+    assert engine.student_count == 0
+    with pytest.raises(ValueError):
+        engine.query(7, gt=1)
+
+
+class FakeCursor:
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+    def fetchone(self):
+        return VERSION
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.version_cursor = FakeCursor()
+        self.named_cursor = FakeCursor(rows)
+        self.rolled_back = False
+
+    def cursor(self, name=None):
+        return self.named_cursor if name else self.version_cursor
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def test_load_engine_from_db():
+    conn = FakeConnection([("Иванов", 2, 4)])
+    engine = GradeCountsEngine([2])
+    load_engine_from_db(engine, conn)
+    assert engine.ready
+    assert engine.data_version == VERSION
+    assert engine.query(2, gt=3) == [("Иванов", 4)]
+    assert "REPEATABLE READ" in conn.version_cursor.executed[0]
+    assert conn.rolled_back
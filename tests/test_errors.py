@@ -0,0 +1,41 @@
+from app.ingest.errors import ErrorCollector
+
+
+def collect(total: int, max_details: int = 20, sample_rows: int = 5) -> ErrorCollector:
+    errors = ErrorCollector(max_details, sample_rows)
+    for row in range(2, total + 2):
+        errors.add(row, "grade" if row % 2 else "full_name", f"ошибка {row}")
+    return errors
+
+
+def test_describe_remaining_count_when_details_limited():
+    errors = collect(30, max_details=5)
+    text = errors.describe(10)
+    assert text.count("Строка") == 5
+    assert text.endswith("(и еще 25 ошибок)")
+
+
+def test_describe_remaining_count_when_limit_smaller():
+    errors = collect(30, max_details=20)
+    assert errors.describe(10).endswith("(и еще 20 ошибок)")
+
+
+def test_describe_all_shown():
+    assert "и еще" not in collect(3).describe(10)
+
+
+def test_summary_counts_and_samples():
+    errors = collect(10, max_details=2, sample_rows=2)
+    assert len(errors) == 10
+    assert len(errors.details) == 2
+    assert errors.summary() == {
+        "full_name": {"count": 5, "sample_rows": [2, 4]},
+        "grade": {"count": 5, "sample_rows": [3, 5]},
+    }
+
+
+def test_invalid_ratio():
+    errors = collect(6)
+    assert errors.invalid_ratio_exceeded(10, 50)
+    assert not errors.invalid_ratio_exceeded(12, 50)
+    assert not ErrorCollector(1, 1).invalid_ratio_exceeded(0, 50)
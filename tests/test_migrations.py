@@ -0,0 +1,177 @@
+from pathlib import Path
+import pytest
+from psycopg2 import errors as pg_errors
+from app.db import migrations
+from app.db.migrations import (
+    MODE_BACKFILL, MODE_NO_TRANSACTION, MODE_TRANSACTIONAL, parse_migration_options, split_sql_statements
+)
+
+
+def test_split_simple_statements():
+    assert split_sql_statements("SELECT 1; SELECT 2;\nSELECT 3") == ["SELECT 1", "SELECT 2", "SELECT 3"]
+
+
+def test_split_keeps_semicolons_in_quotes():
+    sql = "INSERT INTO t VALUES ('a;b', 'it''s;'); SELECT \"col;name\" FROM t;"
+    assert split_sql_statements(sql) == [
+        "INSERT INTO t VALUES ('a;b', 'it''s;')",
+        'SELECT "col;name" FROM t',
+    ]
+
+
+def test_split_keeps_semicolons_in_comments():
+    sql = "-- первый; комментарий\nSELECT 1; /* блок; комментария */ SELECT 2;"
+    assert split_sql_statements(sql) == [
+        "-- первый; комментарий\nSELECT 1",
+        "/* блок; комментария */ SELECT 2",
+    ]
+
+
+def test_split_dollar_quoted_blocks():
+    sql = """
+        DO $$ BEGIN PERFORM 1; PERFORM 2; END $$;
+        CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql;
+    """
+    statements = split_sql_statements(sql)
+    assert statements == [
+        "DO $$ BEGIN PERFORM 1; PERFORM 2; END $$",
+        "CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql",
+    ]
+
+
+def test_split_dollar_sign_outside_quote_tag():
+    assert split_sql_statements("SELECT $1; SELECT 2") == ["SELECT $1", "SELECT 2"]
+
+
+def test_split_drops_comment_only_fragments():
+    assert split_sql_statements("SELECT 1;\n-- только комментарий\n;\n/* и тут */") == ["SELECT 1"]
+
+
+def test_options_default_transactional():
+    options = parse_migration_options(Path("004_x.sql"), "\n-- Миграция 004: описание\nSELECT 1;")
+    assert options["migration"] == MODE_TRANSACTIONAL
+    assert options["lock-timeout"] == migrations.MIGRATION_LOCK_TIMEOUT
+
+
+def test_options_notx_suffix_and_directive():
+    assert parse_migration_options(Path("005_x.notx.sql"), "SELECT 1;")["migration"] == MODE_NO_TRANSACTION
+    sql = "-- migration: no-transaction\n-- lock-timeout: 10s\nSELECT 1;"
+    options = parse_migration_options(Path("005_x.sql"), sql)
+    assert options["migration"] == MODE_NO_TRANSACTION
+    assert options["lock-timeout"] == "10s"
+
+
+def test_options_stop_at_first_statement():
+    options = parse_migration_options(Path("005_x.sql"), "SELECT 1;\n-- migration: no-transaction")
+    assert options["migration"] == MODE_TRANSACTIONAL
+
+
+def test_options_backfill():
+    sql = "-- migration: backfill\n-- backfill-table: grades\n-- backfill-key: id\nUPDATE grades SET grade = grade;"
+    options = parse_migration_options(Path("006_x.sql"), sql)
+    assert options["migration"] == MODE_BACKFILL
+    assert options["backfill-batch-size"] == 10000
+
+
+def test_options_backfill_requires_key():
+    with pytest.raises(ValueError):
+        parse_migration_options(Path("006_x.sql"), "-- migration: backfill\n-- backfill-table: grades\nSELECT 1;")
+
+
+def test_options_unknown_mode():
+    with pytest.raises(ValueError):
+        parse_migration_options(Path("006_x.sql"), "-- migration: sometimes\nSELECT 1;")
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+        if self.conn.fail_on and sql.startswith(self.conn.fail_on) and self.conn.failures:
+            self.conn.failures -= 1
+            raise pg_errors.LockNotAvailable()
+        self.conn.last = sql
+
+    def fetchone(self):
+        return self.conn.results.pop(0)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, fail_on=None, failures=0, results=None):
+        self.autocommit = False
+        self.executed = []
+        self.fail_on = fail_on
+        self.failures = failures
+        self.results = results or []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def test_no_transaction_retry_restarts_from_first_statement(monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATION_LOCK_RETRY_DELAY", 0)
+    path = Path("migrations/005_grades_created_at_index.notx.sql")
+    sql = path.read_text(encoding="utf-8")
+    conn = FakeConnection(fail_on="CREATE INDEX", failures=1)
+
+    migrations._apply_no_transaction(conn, path.stem, path, sql, parse_migration_options(path, sql))
+
+    # Комментарии в начале файла входят в текст первого оператора
+    statements = [s for s in conn.executed if "INDEX CONCURRENTLY" in s]
+    assert ["DROP INDEX" in s for s in statements] == [True, False, True, False]
+    assert any("INSERT INTO schema_migrations" in s for s in conn.executed)
+    assert conn.autocommit is False
+
+
+def test_no_transaction_not_recorded_when_retries_exhausted(monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATION_LOCK_RETRY_DELAY", 0)
+    monkeypatch.setattr(migrations, "MIGRATION_LOCK_RETRIES", 1)
+    path = Path("005_x.notx.sql")
+    sql = "DROP INDEX CONCURRENTLY IF EXISTS i; CREATE INDEX CONCURRENTLY IF NOT EXISTS i ON t(c);"
+    conn = FakeConnection(fail_on="CREATE INDEX", failures=5)
+
+    with pytest.raises(pg_errors.LockNotAvailable):
+        migrations._apply_no_transaction(conn, path.stem, path, sql, parse_migration_options(path, sql))
+    assert not any("INSERT INTO schema_migrations" in s for s in conn.executed)
+
+
+def test_backfill_resume_uses_stored_upper_bound():
+    path = Path("006_x.sql")
+    sql = (
+        "-- migration: backfill\n-- backfill-table: t\n-- backfill-key: id\n-- backfill-batch-size: 10\n"
+        "UPDATE t SET c = 1 WHERE id > %(start)s AND id <= %(end)s;"
+    )
+    # MIN/MAX сейчас 1..100, но при первом запуске граница была 30, обработано до 20
+    conn = FakeConnection(results=[(1, 100), (20, 30)])
+
+    migrations._apply_backfill(conn, path.stem, path, sql, parse_migration_options(path, sql))
+
+    batches = [s for s in conn.executed if s.startswith("-- migration")]
+    assert len(batches) == 1
+
+
+def test_backfill_resume_after_table_emptied():
+    path = Path("006_x.sql")
+    sql = (
+        "-- migration: backfill\n-- backfill-table: t\n-- backfill-key: id\n-- backfill-batch-size: 10\n"
+        "UPDATE t SET c = 1 WHERE id > %(start)s AND id <= %(end)s;"
+    )
+    # Строки удалены после первого запуска: MIN/MAX — NULL, сохранено 20 из 30
+    conn = FakeConnection(results=[(None, None), (20, 30)])
+
+    migrations._apply_backfill(conn, path.stem, path, sql, parse_migration_options(path, sql))
+
+    batches = [s for s in conn.executed if s.startswith("-- migration")]
+    assert len(batches) == 1
+    assert "SET completed = TRUE" in conn.executed[-1]
@@ -0,0 +1,58 @@
+import pytest
+from app.config import ProfilingConfig
+from app.db.profiling import _is_read_only, _normalize_query
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT full_name, count FROM grade_counts WHERE grade = 2",
+    "  select 1",
+    "WITH s AS (SELECT full_name FROM grades) SELECT COUNT(*) FROM s",
+    "SELECT updated_at FROM data_version",
+    "SELECT * FROM grades WHERE full_name = 'Обновлений нет'",
+    "SELECT nextvalue FROM t",
+])
+def test_read_only_queries(query):
+    assert _is_read_only(query)
+
+
+@pytest.mark.parametrize("query", [
+    "INSERT INTO grades (full_name, grade) VALUES ('Иванов', 2)",
+    "UPDATE data_version SET version = version + 1",
+    "DELETE FROM grades",
+    "EXPLAIN SELECT 1",
+    "VACUUM grades",
+    "WITH moved AS (DELETE FROM grades RETURNING *) SELECT COUNT(*) FROM moved",
+    "WITH x AS (INSERT INTO t VALUES (1) RETURNING id) SELECT id FROM x",
+    "SELECT name, data FROM grade_sketches FOR UPDATE",
+    "SELECT id FROM grades FOR NO KEY UPDATE SKIP LOCKED",
+    "SELECT id FROM grades for share",
+    "SELECT id FROM grades FOR KEY SHARE",
+    "SELECT nextval('grades_id_seq')",
+    "SELECT setval('grades_id_seq', 1)",
+    "SELECT pg_advisory_xact_lock(1)",
+    "SELECT pg_notify('ch', 'x')",
+    "SELECT * FROM dblink_exec('host=x', 'DELETE FROM t')",
+])
+def test_modifying_queries(query):
+    assert not _is_read_only(query)
+
+
+def test_normalize_query():
+    assert _normalize_query(b"SELECT\n   1,\t2") == "SELECT 1, 2"
+    assert len(_normalize_query("SELECT " + "x" * 5000)) == 2000
+
+
+@pytest.mark.parametrize("name, value", [
+    ("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 1.5),
+    ("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", -0.1),
+    ("SLOW_QUERY_THRESHOLD_MS", -1),
+    ("SLOW_QUERY_BUFFER_SIZE", 0),
+])
+def test_profiling_config_rejects_invalid_values(monkeypatch, name, value):
+    monkeypatch.setattr(ProfilingConfig, name, value)
+    with pytest.raises(ValueError, match=name):
+        ProfilingConfig.validate()
+
+
+def test_profiling_config_defaults_valid():
+    assert ProfilingConfig.validate()
@@ -0,0 +1,71 @@
+import gzip
+import pytest
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.testclient import TestClient
+from app.api.request_decompression import RequestDecompressionMiddleware, is_request_decompressed
+
+zstandard = pytest.importorskip("zstandard")
+
+BOUNDARY = "test-boundary"
+HEADERS = {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+CSV = b"full_name,grade\n" + b"".join(b"Student %d,2\n" % i for i in range(1000))
+
+app = FastAPI()
+app.add_middleware(RequestDecompressionMiddleware)
+
+
+@app.post("/echo")
+async def echo(request: Request, file: UploadFile = File(...)):
+    content = await file.read()
+    return {"size": len(content), "decompressed": is_request_decompressed(request)}
+
+
+@app.get("/ping")
+async def ping(request: Request):
+    return {"decompressed": is_request_decompressed(request)}
+
+
+client = TestClient(app)
+
+
+def multipart(content: bytes, filename: str = "grades.csv") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: text/csv\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+@pytest.mark.parametrize("encoding, compress", [
+    ("gzip", gzip.compress),
+    ("zstd", lambda data: zstandard.ZstdCompressor().compress(data)),
+])
+def test_compressed_request_is_decompressed_and_marked(encoding, compress):
+    response = client.post("/echo", content=compress(multipart(CSV)), headers={**HEADERS, "Content-Encoding": encoding})
+    assert response.status_code == 200
+    assert response.json() == {"size": len(CSV), "decompressed": True}
+
+
+def test_plain_request_not_marked():
+    response = client.post("/echo", content=multipart(CSV), headers=HEADERS)
+    assert response.json() == {"size": len(CSV), "decompressed": False}
+
+
+def test_truncated_request_body_rejected():
+    body = gzip.compress(multipart(CSV))
+    response = client.post("/echo", content=body[:-10], headers={**HEADERS, "Content-Encoding": "gzip"})
+    assert response.status_code == 400
+
+
+def test_body_not_matching_declared_encoding_rejected():
+    response = client.post("/echo", content=multipart(CSV), headers={**HEADERS, "Content-Encoding": "gzip"})
+    assert response.status_code == 400
+
+
+def test_unsupported_encoding():
+    response = client.post("/echo", content=multipart(CSV), headers={**HEADERS, "Content-Encoding": "br"})
+    assert response.status_code == 415
+
+
+def test_empty_body_passed_through():
+    response = client.get("/ping", headers={"Content-Encoding": "gzip"})
+    assert response.json() == {"decompressed": False}
@@ -0,0 +1,107 @@
+import gzip
+import json
+from datetime import datetime, timezone
+import pytest
+from starlette.requests import Request
+from app.api import responses
+from app.api.responses import is_not_modified, make_etag, negotiate_encoding, versioned_json_response
+
+UPDATED_AT = datetime(2024, 3, 1, 12, 30, 15, tzinfo=timezone.utc)
+ETAG = make_etag("students", 7)
+
+
+def make_request(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    responses._cache.clear()
+    yield
+    responses._cache.clear()
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("*", "br"),
+    ("*;q=0", None),
+    ("*, br;q=0", "gzip"),
+    ("identity", None),
+    ("gzip;q=abc", None),
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+def test_negotiate_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(responses, "brotli", None)
+    assert negotiate_encoding("br, gzip;q=0.5") == "gzip"
+    assert negotiate_encoding("br") is None
+
+
+@pytest.mark.parametrize("if_none_match, expected", [
+    (ETAG, True),
+    (ETAG.removeprefix("W/"), True),
+    (f'W/"6-students", {ETAG}', True),
+    ('W/"6-students", "8-students"', False),
+    ("*", True),
+    ('W/"7-other"', False),
+])
+def test_if_none_match(if_none_match, expected):
+    assert is_not_modified(make_request(if_none_match=if_none_match), ETAG, UPDATED_AT) is expected
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    request = make_request(if_none_match='W/"6-students"', if_modified_since="Fri, 01 Mar 2024 12:30:15 GMT")
+    assert not is_not_modified(request, ETAG, UPDATED_AT)
+
+
+@pytest.mark.parametrize("if_modified_since, expected", [
+    ("Fri, 01 Mar 2024 12:30:15 GMT", True),
+    ("Fri, 01 Mar 2024 12:31:00 GMT", True),
+    ("Fri, 01 Mar 2024 12:30:14 GMT", False),
+    ("не дата", False),
+])
+def test_if_modified_since(if_modified_since, expected):
+    assert is_not_modified(make_request(if_modified_since=if_modified_since), ETAG, UPDATED_AT) is expected
+
+
+def test_unconditional_request():
+    assert not is_not_modified(make_request(), ETAG, UPDATED_AT)
+
+
+def test_body_built_once_per_version():
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {"students": ["Иванов Иван"] * 200}
+
+    first = versioned_json_response(make_request(), "students", 7, UPDATED_AT, build)
+    second = versioned_json_response(make_request(accept_encoding="gzip"), "students", 7, UPDATED_AT, build)
+    assert len(calls) == 1
+    assert first.headers["etag"] == ETAG
+    assert first.headers["last-modified"] == "Fri, 01 Mar 2024 12:30:15 GMT"
+    assert second.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(second.body)) == json.loads(first.body)
+
+    versioned_json_response(make_request(), "students", 8, UPDATED_AT, build)
+    assert len(calls) == 2
+
+
+def test_not_modified_skips_build():
+    def build():
+        raise AssertionError("build не должен вызываться")
+
+    response = versioned_json_response(make_request(if_none_match=ETAG), "students", 7, UPDATED_AT, build)
+    assert response.status_code == 304
+    assert response.headers["etag"] == ETAG
@@ -0,0 +1,170 @@
+import random
+from collections import Counter
+import pytest
+from app.analytics import sketches
+from app.analytics.sketches import CountMinSketch, HyperLogLog, build_sketches, grade_key, update_sketches
+
+
+def random_counts(seed: int, students: int) -> Counter:
+    rng = random.Random(seed)
+    return Counter({
+        (f"Студент {i}", rng.choice([2, 3, 4, 5])): rng.randint(1, 50)
+        for i in range(students)
+    })
+
+
+def test_cms_round_trip():
+    cms = CountMinSketch(width=64, depth=3)
+    cms.add(grade_key("Иванов Иван", 2), 7)
+    restored = CountMinSketch.from_bytes(cms.to_bytes())
+    assert (restored.width, restored.depth, restored.total) == (64, 3, 7)
+    assert restored.counters == cms.counters
+    assert restored.estimate(grade_key("Иванов Иван", 2)) == 7
+
+
+def test_hll_round_trip():
+    hll = HyperLogLog(precision=6)
+    for i in range(100):
+        hll.add(str(i))
+    restored = HyperLogLog.from_bytes(hll.to_bytes())
+    assert restored.precision == 6
+    assert restored.registers == hll.registers
+
+
+def test_cms_never_underestimates():
+    # Маленький скетч, чтобы коллизий было много
+    cms = CountMinSketch(width=50, depth=3)
+    counts = random_counts(1, 2000)
+    for (full_name, grade), count in counts.items():
+        cms.add(grade_key(full_name, grade), count)
+
+    overestimates = [
+        cms.estimate(grade_key(full_name, grade)) - count
+        for (full_name, grade), count in counts.items()
+    ]
+    assert min(overestimates) >= 0
+    assert max(overestimates) > 0
+    assert cms.total == sum(counts.values())
+
+
+def test_cms_merge_equals_single_sketch():
+    first, second = random_counts(2, 500), random_counts(3, 500)
+    merged = CountMinSketch(width=200, depth=4)
+    other = CountMinSketch(width=200, depth=4)
+    single = CountMinSketch(width=200, depth=4)
+    for (full_name, grade), count in first.items():
+        merged.add(grade_key(full_name, grade), count)
+        single.add(grade_key(full_name, grade), count)
+    for (full_name, grade), count in second.items():
+        other.add(grade_key(full_name, grade), count)
+        single.add(grade_key(full_name, grade), count)
+
+    merged.merge(other)
+    assert merged.counters == single.counters
+    assert merged.total == single.total
+
+
+def test_cms_merge_rejects_different_sizes():
+    with pytest.raises(ValueError):
+        CountMinSketch(width=10, depth=2).merge(CountMinSketch(width=20, depth=2))
+
+
+def test_hll_error_at_known_cardinality():
+    hll = HyperLogLog(precision=12)
+    cardinality = 50_000
+    for i in range(cardinality):
+        hll.add(f"Студент {i}")
+    # Три стандартные ошибки: 1.04 / sqrt(4096) ~ 1.6%
+    assert abs(hll.estimate() - cardinality) / cardinality < 3 * hll.relative_error
+
+
+def test_hll_small_cardinality_is_exact_enough():
+    hll = HyperLogLog(precision=14)
+    for i in range(100):
+        hll.add(f"Студент {i}")
+    assert abs(hll.estimate() - 100) <= 2
+
+
+def test_hll_merge_is_union():
+    first, second, union = HyperLogLog(10), HyperLogLog(10), HyperLogLog(10)
+    for i in range(3000):
+        first.add(str(i))
+        union.add(str(i))
+    for i in range(2000, 6000):
+        second.add(str(i))
+        union.add(str(i))
+    first.merge(second)
+    assert first.registers == union.registers
+
+
+class FakeCursor:
+    def __init__(self, conn, stored):
+        self.connection = conn
+        self.stored = stored
+        self.saved = None
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return self.stored
+
+    def executemany(self, sql, rows):
+        self.saved = dict(rows)
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.named_cursors = []
+
+    def cursor(self, name=None):
+        self.named_cursors.append(name)
+        return FakeNamedCursor(self.rows)
+
+
+class FakeNamedCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.closed = False
+
+    def execute(self, sql, params=None):
+        pass
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        self.closed = True
+
+
+def test_first_update_builds_sketches_from_existing_data(monkeypatch):
+    monkeypatch.setattr(sketches.analytics_config, "SKETCH_CMS_EPSILON", 0.01)
+    # Строки текущей загрузки уже вставлены и входят в grade_counts
+    rows = [("Старый Студент", 2, 10), ("Новый Студент", 2, 1)]
+    conn = FakeConnection(rows)
+    cursor = FakeCursor(conn, [(sketches.CMS_SKETCH_NAME, None), (sketches.HLL_SKETCH_NAME, None)])
+
+    update_sketches(cursor, Counter({("Новый Студент", 2): 1}))
+
+    cms = CountMinSketch.from_bytes(cursor.saved[sketches.CMS_SKETCH_NAME])
+    hll = HyperLogLog.from_bytes(cursor.saved[sketches.HLL_SKETCH_NAME])
+    assert cms.total == 11
+    assert cms.estimate(grade_key("Старый Студент", 2)) >= 10
+    assert hll.estimate() == 2
+    assert conn.named_cursors == ["build_sketches"]
+
+
+def test_update_merges_into_stored_sketches(monkeypatch):
+    monkeypatch.setattr(sketches.analytics_config, "SKETCH_CMS_EPSILON", 0.01)
+    cms, hll = build_sketches([("Старый Студент", 2, 10)])
+    conn = FakeConnection([])
+    cursor = FakeCursor(conn, [
+        (sketches.CMS_SKETCH_NAME, cms.to_bytes()),
+        (sketches.HLL_SKETCH_NAME, hll.to_bytes())
+    ])
+
+    update_sketches(cursor, Counter({("Новый Студент", 2): 1}))
+
+    assert CountMinSketch.from_bytes(cursor.saved[sketches.CMS_SKETCH_NAME]).total == 11
+    assert conn.named_cursors == []